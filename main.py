@@ -1,12 +1,25 @@
 from __future__ import annotations
-import os, io, time, json
+import os, io, re, hmac, math, time, json, zlib, base64, heapq, bisect, codecs, shutil, socket, asyncio, hashlib, tempfile, itertools, threading
+from array import array
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX dev boxes: cross-process locking is skipped
+    fcntl = None
 
 import jwt
-from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Header, Request
+import numpy as np
+import pandas as pd
+try:  # optional: Parquet exports
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+from fastapi import FastAPI, UploadFile, File, Form, Depends, HTTPException, Header, Request, Response, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
 # -------------------------------------------------
@@ -20,6 +33,9 @@ ACCESS_TOKEN_EXPIRE_SECONDS = int(os.getenv("ACCESS_TOKEN_EXPIRE_SECONDS", "60")
 RATE_LIMIT_PER_MIN = int(os.getenv("RATE_LIMIT_PER_MIN", "90"))
 RATE_LIMIT_BURST   = int(os.getenv("RATE_LIMIT_BURST", "30"))
 
+# On-disk state (knowledge segments, ...). Empty string keeps everything in memory.
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
 UI_ORIGINS = [o.strip() for o in os.getenv("UI_ORIGINS", "*").split(",") if o.strip()]
 
 # -------------------------------------------------
@@ -31,49 +47,1684 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=UI_ORIGINS,
     allow_credentials=True,
-    allow_methods=["GET","POST","OPTIONS"],
-    allow_headers=["Authorization","Content-Type","Accept","X-Requested-With"],
-    expose_headers=["Authorization"],
+    allow_methods=["GET","POST","PUT","OPTIONS"],
+    allow_headers=["Authorization","Content-Type","Accept","X-Requested-With","Range","If-None-Match","If-Modified-Since","Last-Event-ID"],
+    expose_headers=["Authorization","X-Next-Cursor","Content-Disposition","Content-Range","Accept-Ranges","ETag","Last-Modified"],
     max_age=600,
 )
 
 # -------------------------------------------------
-# Minimal stores (MVP in-memory)
+# Storage (repository layer)
 # -------------------------------------------------
-USERS: Dict[str, Dict[str, Any]] = {
-    ADMIN_USER: {"username": ADMIN_USER, "password": ADMIN_PASS, "role": "admin"}
-}
+# Every domain collection is a table with the same small API on one of two backends:
+#   memory   dicts/lists in this process (STORAGE=memory, the default when DATA_DIR is empty; tests)
+#   sqlite   one WAL-mode database file shared by all workers (DB_PATH, default DATA_DIR/hexcarb.db)
+# Rows are JSON documents. The key and the listed index columns are mirrored into real
+# columns, so lookups and filters use SQLite indexes. All SQL is built once per table, so
+# every call reuses a cached prepared statement on its pooled connection.
+import queue, sqlite3
+from contextlib import contextmanager
+
+STORAGE = os.getenv("STORAGE", "sqlite" if DATA_DIR else "memory")
+DB_PATH = os.getenv("DB_PATH", os.path.join(DATA_DIR or ".", "hexcarb.db"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+class MemoryTable:
+    # rows by insertion number (seq) + key index + one seq-sorted hash index per non-ts index
+    # column. ts is assigned at insert time, so seq order is ts order: newest-first listing
+    # is a reversed slice and ts ranges are a bisect.
+    def __init__(self, name: str, key: Optional[str] = None, indexes: tuple = ()):
+        self.name, self.key, self.indexes = name, key, indexes
+        self.order: List[int] = []                       # seqs, ascending
+        self.by_seq: Dict[int, Dict[str, Any]] = {}
+        self.by_key: Dict[str, int] = {}
+        self.hashed: Dict[str, Dict[Any, List[int]]] = {c: {} for c in indexes if c != "ts"}
+        self.next_seq = 0
+        self.epoch = f"{time.time_ns():x}"  # counters restart with the process; keep old ETags from matching
+        self.changes, self.modified = 0, time.time()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, k: str) -> bool:
+        return k in self.by_key
+
+    def _bump(self) -> None:
+        self.changes += 1; self.modified = time.time()
+
+    def version(self) -> tuple:
+        # -> (opaque tag that changes on every write, last write as epoch seconds)
+        return f"{self.epoch}.{self.changes}", self.modified
+
+    def _index(self, n: int, row: Dict[str, Any]) -> None:
+        for c, buckets in self.hashed.items():
+            bucket = buckets.setdefault(row.get(c), [])
+            if not bucket or bucket[-1] < n:
+                bucket.append(n)
+            else:
+                bisect.insort(bucket, n)
+
+    def _unindex(self, n: int, row: Dict[str, Any]) -> None:
+        for c, buckets in self.hashed.items():
+            bucket = buckets.get(row.get(c))
+            if bucket:
+                i = bisect.bisect_left(bucket, n)
+                if i < len(bucket) and bucket[i] == n:
+                    del bucket[i]
+                if not bucket:
+                    del buckets[row.get(c)]
+
+    def _append(self, row: Dict[str, Any]) -> None:
+        n = self.next_seq; self.next_seq += 1
+        if self.key:
+            self.by_key[row[self.key]] = n
+        self.order.append(n)
+        self.by_seq[n] = row
+        self._index(n, row)
+
+    def get(self, k: str) -> Optional[Dict[str, Any]]:
+        n = self.by_key.get(k)
+        return None if n is None else self.by_seq[n]
+
+    def insert(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        self.insert_many([row])
+        return row
+
+    def insert_many(self, rows: List[Dict[str, Any]], then: Optional[Callable] = None) -> int:
+        # `then(None)` runs under the same lock, after the rows are in (see SqliteTable)
+        with self.lock:
+            for row in rows:
+                if self.key and row[self.key] in self.by_key:
+                    raise KeyError(f"{self.name}: duplicate key {row[self.key]}")
+                self._append(row)
+            if then:
+                then(None)
+            self._bump()
+        return len(rows)
+
+    def put(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        # upsert by key; an existing row keeps its position
+        with self.lock:
+            self._bump()
+            n = self.by_key.get(row[self.key])
+            if n is None:
+                self._append(row)
+                return row
+            cur = self.by_seq[n]
+            self._unindex(n, cur)
+            cur.clear(); cur.update(row)
+            self._index(n, cur)
+            return cur
+
+    def update(self, k: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            n = self.by_key.get(k)
+            if n is None:
+                return None
+            row = self.by_seq[n]
+            self._unindex(n, row)
+            row.update(fields)
+            self._index(n, row)
+            self._bump()
+            return row
+
+    def delete(self, k: str) -> bool:
+        with self.lock:
+            n = self.by_key.pop(k, None)
+            if n is None:
+                return False
+            self._unindex(n, self.by_seq.pop(n))
+            del self.order[bisect.bisect_left(self.order, n)]
+            self._bump()
+            return True
+
+    def _candidates(self, eq: Dict[str, Any]) -> List[int]:
+        # seqs to scan: the smallest matching bucket, or everything
+        bad = set(eq) - set(self.hashed)
+        if bad:
+            raise ValueError(f"{self.name}: not indexed: {sorted(bad)}")
+        if not eq:
+            return self.order
+        return min((self.hashed[c].get(v, []) for c, v in eq.items()), key=len)
+
+    def find(self, ts_min: Optional[int] = None, ts_max: Optional[int] = None, **eq) -> List[Dict[str, Any]]:
+        # equality on index columns and/or an inclusive ts range, oldest first
+        seqs = self._candidates(eq)
+        ts = lambda n: self.by_seq[n]["ts"]
+        lo = 0 if ts_min is None else bisect.bisect_left(seqs, ts_min, key=ts)
+        hi = len(seqs) if ts_max is None else bisect.bisect_right(seqs, ts_max, key=ts)
+        rows = [self.by_seq[n] for n in seqs[lo:hi]]
+        return [r for r in rows if all(r.get(c) == v for c, v in eq.items())] if len(eq) > 1 else rows
+
+    def page(self, limit: int, before: Optional[int] = None, ts_min: Optional[int] = None,
+             ts_max: Optional[int] = None, **eq) -> tuple:
+        # newest first, starting below seq `before` -> (rows, seq to continue from or None)
+        seqs = self._candidates(eq)
+        ts = lambda n: self.by_seq[n]["ts"]
+        hi = len(seqs) if before is None else bisect.bisect_left(seqs, before)
+        if ts_max is not None:
+            hi = min(hi, bisect.bisect_right(seqs, ts_max, key=ts))
+        lo = 0 if ts_min is None else bisect.bisect_left(seqs, ts_min, key=ts)
+        out: List[tuple] = []  # (seq, row); one extra match tells whether there is a next page
+        i = hi - 1
+        while i >= lo and len(out) <= limit:
+            r = self.by_seq[seqs[i]]
+            if len(eq) < 2 or all(r.get(c) == v for c, v in eq.items()):
+                out.append((seqs[i], r))
+            i -= 1
+        more = len(out) > limit
+        out = out[:limit]
+        return [r for _, r in out], (out[-1][0] if more else None)
+
+    def after(self, seq: int, limit: int, **eq) -> List[tuple]:
+        # -> [(seq, row)] inserted after `seq`, oldest first, optionally matching index columns
+        # (derived indexes catching up, exports)
+        seqs = self._candidates(eq)
+        i = bisect.bisect_right(seqs, seq)
+        if len(eq) < 2:
+            return [(n, self.by_seq[n]) for n in seqs[i:i + limit]]
+        out: List[tuple] = []
+        for n in seqs[i:]:
+            r = self.by_seq[n]
+            if all(r.get(c) == v for c, v in eq.items()):
+                out.append((n, r))
+                if len(out) == limit:
+                    break
+        return out
+
+    def head(self) -> int:
+        # seq of the newest row; after(head()) only sees rows inserted from now on
+        return self.order[-1] if self.order else -1
+
+    def oldest(self) -> Optional[int]:
+        return self.order[0] if self.order else None
+
+    def prune(self, seq: int) -> int:
+        # drop every row with seq <= `seq` (retention of append-only logs) -> rows dropped
+        with self.lock:
+            i = bisect.bisect_right(self.order, seq)
+            for n in self.order[:i]:
+                row = self.by_seq.pop(n)
+                self._unindex(n, row)
+                if self.key:
+                    self.by_key.pop(row[self.key], None)
+            del self.order[:i]
+            if i:
+                self._bump()
+            return i
+
+    def all(self) -> List[Dict[str, Any]]:
+        return [self.by_seq[n] for n in self.order]
+
+class _SqlitePool:
+    def __init__(self, path: str, size: int = DB_POOL_SIZE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                               check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def conn(self):
+        with self.slots:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self.idle.put(conn)
+
+    @contextmanager
+    def tx(self):
+        # write transaction; IMMEDIATE takes the write lock up front so read-modify-write is atomic
+        with self.conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.execute("COMMIT")
+
+_SQL_TYPES = {"ts": "INTEGER"}
+
+class SqliteTable:
+    def __init__(self, pool: _SqlitePool, name: str, key: Optional[str] = None, indexes: tuple = ()):
+        self.pool, self.name, self.key, self.indexes = pool, name, key, indexes
+        cols = "".join(f", {c} {_SQL_TYPES.get(c, 'TEXT')}" for c in indexes)
+        with pool.conn() as conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {name} (seq INTEGER PRIMARY KEY AUTOINCREMENT, k TEXT UNIQUE{cols}, data TEXT NOT NULL)")
+            for c in indexes:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{name}_{c} ON {name} ({c})")
+            # one change counter per table, bumped inside every write transaction (ETags)
+            conn.execute("CREATE TABLE IF NOT EXISTS _versions (name TEXT PRIMARY KEY, v INTEGER NOT NULL, ts REAL NOT NULL)")
+            # random id of this database file, so ETags from another instance or a recreated DB never match
+            conn.execute("INSERT OR IGNORE INTO _versions (name, v, ts) VALUES ('_db', ?, ?)",
+                         (int.from_bytes(os.urandom(7), "big"), time.time()))
+            self.epoch = "%x" % conn.execute("SELECT v FROM _versions WHERE name = '_db'").fetchone()[0]
+        names = ", ".join(("k",) + indexes + ("data",))
+        marks = ", ".join("?" * (len(indexes) + 2))
+        sets = ", ".join(f"{c} = excluded.{c}" for c in indexes + ("data",))
+        self.sql_insert = f"INSERT INTO {name} ({names}) VALUES ({marks})"
+        self.sql_put = f"{self.sql_insert} ON CONFLICT(k) DO UPDATE SET {sets}"
+        self.sql_update = f"UPDATE {name} SET {', '.join(f'{c} = ?' for c in indexes + ('data',))} WHERE k = ?"
+        self.sql_get = f"SELECT data FROM {name} WHERE k = ?"
+        self.sql_delete = f"DELETE FROM {name} WHERE k = ?"
+        self.sql_count = f"SELECT COUNT(*) FROM {name}"
+        self.sql_all = f"SELECT data FROM {name} ORDER BY seq"
+        self.sql_after = f"SELECT seq, data FROM {name} WHERE seq > ? ORDER BY seq LIMIT ?"
+        self.sql_bump = ("INSERT INTO _versions (name, v, ts) VALUES (?, 1, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET v = v + 1, ts = excluded.ts")
+        self.sql_version = "SELECT v, ts FROM _versions WHERE name = ?"
+        self.created = time.time()
+
+    def _bump(self, conn: sqlite3.Connection) -> None:
+        conn.execute(self.sql_bump, (self.name, time.time()))
+
+    def version(self) -> tuple:
+        with self.pool.conn() as conn:
+            hit = conn.execute(self.sql_version, (self.name,)).fetchone()
+        return (f"{self.epoch}.{hit[0]}", hit[1]) if hit else (f"{self.epoch}.0", self.created)
+
+    def _params(self, row: Dict[str, Any]) -> tuple:
+        k = row[self.key] if self.key else None
+        return (k,) + tuple(row.get(c) for c in self.indexes) + (json.dumps(row, separators=(",", ":")),)
+
+    def __len__(self) -> int:
+        with self.pool.conn() as conn:
+            return conn.execute(self.sql_count).fetchone()[0]
+
+    def __contains__(self, k: str) -> bool:
+        return self.get(k) is not None
+
+    def get(self, k: str) -> Optional[Dict[str, Any]]:
+        with self.pool.conn() as conn:
+            hit = conn.execute(self.sql_get, (k,)).fetchone()
+        return json.loads(hit[0]) if hit else None
+
+    def insert(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        self.insert_many([row])
+        return row
+
+    def insert_many(self, rows: List[Dict[str, Any]], then: Optional[Callable] = None) -> int:
+        # `then(conn)` runs in the same transaction, so derived state commits (or not) with the rows
+        try:
+            with self.pool.tx() as conn:
+                conn.executemany(self.sql_insert, [self._params(r) for r in rows])
+                if then:
+                    then(conn)
+                self._bump(conn)
+        except sqlite3.IntegrityError as e:
+            raise KeyError(f"{self.name}: {e}")
+        return len(rows)
+
+    def put(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        with self.pool.tx() as conn:
+            conn.execute(self.sql_put, self._params(row))
+            self._bump(conn)
+        return row
+
+    def update(self, k: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.pool.tx() as conn:
+            hit = conn.execute(self.sql_get, (k,)).fetchone()
+            if not hit:
+                return None
+            row = json.loads(hit[0]); row.update(fields)
+            conn.execute(self.sql_update, self._params(row)[1:] + (k,))
+            self._bump(conn)
+        return row
+
+    def delete(self, k: str) -> bool:
+        with self.pool.tx() as conn:
+            if conn.execute(self.sql_delete, (k,)).rowcount == 0:
+                return False
+            self._bump(conn)
+            return True
+
+    def find(self, ts_min: Optional[int] = None, ts_max: Optional[int] = None, **eq) -> List[Dict[str, Any]]:
+        # equality on index columns and/or an inclusive ts range, all served by SQLite indexes
+        bad = set(eq) - set(self.indexes)
+        if bad:
+            raise ValueError(f"{self.name}: not indexed: {sorted(bad)}")
+        where = [f"{c} = ?" for c in eq]
+        params = list(eq.values())
+        if ts_min is not None:
+            where.append("ts >= ?"); params.append(ts_min)
+        if ts_max is not None:
+            where.append("ts <= ?"); params.append(ts_max)
+        sql = f"SELECT data FROM {self.name}{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY seq"
+        with self.pool.conn() as conn:
+            return [json.loads(d) for (d,) in conn.execute(sql, params)]
+
+    def page(self, limit: int, before: Optional[int] = None, ts_min: Optional[int] = None,
+             ts_max: Optional[int] = None, **eq) -> tuple:
+        # newest first, starting below seq `before` -> (rows, seq to continue from or None)
+        bad = set(eq) - set(self.indexes)
+        if bad:
+            raise ValueError(f"{self.name}: not indexed: {sorted(bad)}")
+        where = [f"{c} = ?" for c in eq]
+        params: List[Any] = list(eq.values())
+        for cond, v in (("seq < ?", before), ("ts >= ?", ts_min), ("ts <= ?", ts_max)):
+            if v is not None:
+                where.append(cond); params.append(v)
+        sql = (f"SELECT seq, data FROM {self.name}{' WHERE ' + ' AND '.join(where) if where else ''}"
+               f" ORDER BY seq DESC LIMIT ?")
+        with self.pool.conn() as conn:
+            hits = conn.execute(sql, params + [limit + 1]).fetchall()
+        more = len(hits) > limit
+        return [json.loads(d) for _, d in hits[:limit]], (hits[limit - 1][0] if more else None)
+
+    def after(self, seq: int, limit: int, **eq) -> List[tuple]:
+        if not eq:
+            with self.pool.conn() as conn:
+                return [(n, json.loads(d)) for n, d in conn.execute(self.sql_after, (seq, limit))]
+        bad = set(eq) - set(self.indexes)
+        if bad:
+            raise ValueError(f"{self.name}: not indexed: {sorted(bad)}")
+        where = "".join(f" AND {c} = ?" for c in eq)
+        sql = f"SELECT seq, data FROM {self.name} WHERE seq > ?{where} ORDER BY seq LIMIT ?"
+        with self.pool.conn() as conn:
+            return [(n, json.loads(d)) for n, d in conn.execute(sql, [seq, *eq.values(), limit])]
+
+    def head(self) -> int:
+        with self.pool.conn() as conn:
+            return conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {self.name}").fetchone()[0]
+
+    def oldest(self) -> Optional[int]:
+        with self.pool.conn() as conn:
+            return conn.execute(f"SELECT MIN(seq) FROM {self.name}").fetchone()[0]
+
+    def prune(self, seq: int) -> int:
+        with self.pool.tx() as conn:
+            n = conn.execute(f"DELETE FROM {self.name} WHERE seq <= ?", (seq,)).rowcount
+            if n:
+                self._bump(conn)
+            return n
+
+    def all(self) -> List[Dict[str, Any]]:
+        with self.pool.conn() as conn:
+            return [json.loads(d) for (d,) in conn.execute(self.sql_all)]
+
+_DB_POOL = _SqlitePool(DB_PATH) if STORAGE == "sqlite" else None
+
+def table(name: str, key: Optional[str] = None, indexes: tuple = ()):
+    if _DB_POOL is not None:
+        return SqliteTable(_DB_POOL, name, key, indexes)
+    return MemoryTable(name, key, indexes)
+
+# List endpoints return one page, newest first, as a plain JSON array. When more rows
+# exist, the opaque cursor for the next page is sent in the X-Next-Cursor header.
+PAGE_DEFAULT = int(os.getenv("PAGE_DEFAULT", "100"))
+PAGE_MAX = int(os.getenv("PAGE_MAX", "1000"))
+
+def _encode_cursor(seq: int) -> str:
+    return base64.urlsafe_b64encode(str(seq).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Change feed: every write endpoint appends {collection, op, id, row} to EVENTS once its write is
+# done, and the EVENTS seq is the event id. GET /events streams the feed as Server-Sent Events
+# (resume with Last-Event-ID); GET /events/poll returns what came after a given id. Streams in this
+# process wake up immediately; events written by other workers show up within EVENTS_POLL seconds.
+# Only the newest EVENTS_KEEP events are retained; a client resuming from before them gets a reset.
+EVENTS = table("events", indexes=("ts",))  # {collection, op: insert|update|delete|bulk|..., id, row, ts}
+EVENTS_POLL = float(os.getenv("EVENTS_POLL", "2"))
+EVENTS_KEEP = int(os.getenv("EVENTS_KEEP", "10000"))
+EVENTS_PRUNE_EVERY = 256  # publishes between retention passes
+EVENTS_BATCH = 500
+EVENTS_ADMIN_ONLY = {"users"}  # collections only admins may read from the feed
+_EVENT_PUBLISHES = itertools.count(1)
+_EVENT_WAITERS: set = set()  # (loop, asyncio.Event) per open stream
+_EVENT_WAITERS_LOCK = threading.Lock()
+
+def publish(collection: str, op: str, id: Optional[str] = None, row: Optional[Dict[str, Any]] = None, **extra) -> None:
+    EVENTS.insert({"collection": collection, "op": op, "id": id, "row": row, "ts": int(time.time()), **extra})
+    if next(_EVENT_PUBLISHES) % EVENTS_PRUNE_EVERY == 0:
+        EVENTS.prune(EVENTS.head() - EVENTS_KEEP)
+    with _EVENT_WAITERS_LOCK:
+        waiters = list(_EVENT_WAITERS)
+    for loop, ev in waiters:
+        try:
+            loop.call_soon_threadsafe(ev.set)
+        except RuntimeError:  # loop already closed
+            pass
+
+def events_after(since: Optional[int], collections: Optional[set], limit: int = EVENTS_BATCH, admin: bool = False) -> tuple:
+    # -> (events, id to continue from, reset, more). No `since` means "from now on". An id ahead of
+    # the log (the in-memory store restarted) or older than the retained events means some events
+    # can't be delivered, so the client gets a reset and the retained feed is replayed from its start.
+    head = EVENTS.head()
+    if since is None:
+        return [], head, False, False
+    oldest = EVENTS.oldest()
+    start = oldest - 1 if oldest is not None else -1
+    reset = since > head or since < start
+    if reset:
+        since = start
+    rows = EVENTS.after(since, limit)
+    out = [{"seq": n, **e} for n, e in rows if (not collections or e["collection"] in collections)
+           and (admin or e["collection"] not in EVENTS_ADMIN_ONLY)]
+    return out, rows[-1][0] if rows else since, reset, len(rows) == limit
+
+# Conditional GETs: read endpoints tag their response with the versions of the tables they read.
+# A client presenting the current ETag (If-None-Match) or a date not older than the last write
+# (If-Modified-Since) gets an empty 304 before any query runs or any JSON is serialized.
+from email.utils import formatdate, parsedate_to_datetime
+
+def not_modified(request: Request, response: Response, *tables, extra: str = "") -> Optional[Response]:
+    versions = [t.version() for t in tables]
+    etag = 'W/"' + "-".join([tag for tag, _ in versions] + ([extra] if extra else [])) + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if versions:
+        headers["Last-Modified"] = formatdate(max(ts for _, ts in versions), usegmt=True)
+    response.headers.update(headers)
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        fresh = inm.strip() == "*" or etag in (t.strip() for t in inm.split(","))
+    elif request.headers.get("if-modified-since") and versions:
+        try:
+            fresh = int(max(ts for _, ts in versions)) <= parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+        except (TypeError, ValueError):
+            fresh = False
+    else:
+        fresh = False
+    return Response(status_code=304, headers=headers) if fresh else None
+
+def list_page(tbl, response: Response, limit: int, cursor: Optional[str], **filters) -> List[Dict[str, Any]]:
+    limit = max(1, min(limit, PAGE_MAX))
+    rows, nxt = tbl.page(limit, _decode_cursor(cursor) if cursor else None, **filters)
+    if nxt is not None:
+        response.headers["X-Next-Cursor"] = _encode_cursor(nxt)
+    return rows
+
+# -------------------------------------------------
+# IDs
+# -------------------------------------------------
+# Snowflake-style 64-bit ids: 41 bits of milliseconds since ID_EPOCH_MS | 10 bits worker | 12 bits
+# per-process sequence, rendered as fixed-width decimal so string order is creation order.
+# Each process leases its own 10-bit worker id: it holds an flock on one of 1024 slot files in
+# ID_SLOT_DIR for as long as it lives, so workers forked by `uvicorn --workers N` never share
+# one and a crashed worker's slot frees itself. Hosts writing to one database need disjoint
+# ranges: give each an ID_WORKER_BASE (e.g. 0, 256, 512, ...) further apart than its worker count.
+ID_EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+ID_WORKER_BASE = int(os.getenv("ID_WORKER_BASE", "0"))
+ID_SLOT_DIR = os.getenv("ID_SLOT_DIR", os.path.join(DATA_DIR or tempfile.gettempdir(), "id-slots"))
+
+class IdGenerator:
+    def __init__(self, base: int = 0, slot_dir: str = ""):
+        self.base, self.slot_dir = base, slot_dir
+        self.slot = None  # open, flock'd slot file of this process
+        self.pid = -1
+        self.last_ms = 0
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def _worker(self) -> int:
+        if self.slot is not None:
+            self.slot.close()  # inherited from the parent, whose lock it does not release
+            self.slot = None
+        if fcntl is not None and self.slot_dir:
+            os.makedirs(self.slot_dir, exist_ok=True)
+            for i in range(1024):
+                worker = (self.base + i) & 0x3FF
+                fh = open(os.path.join(self.slot_dir, f"{worker:04d}.lock"), "a")
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    fh.close()
+                    continue
+                self.slot = fh
+                return worker
+            raise RuntimeError(f"all 1024 worker ids in {self.slot_dir} are taken")
+        return zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode()) & 0x3FF  # no flock here
+
+    def _next(self) -> str:
+        ms = int(time.time() * 1000) - ID_EPOCH_MS
+        if ms > self.last_ms:
+            self.last_ms, self.seq = ms, 0
+        else:
+            # same millisecond (or the clock stepped back): keep counting on the last one,
+            # borrowing the next millisecond when 4096 ids were handed out already
+            self.seq += 1
+            if self.seq > 0xFFF:
+                self.last_ms, self.seq = self.last_ms + 1, 0
+        return f"{(self.last_ms << 22) | (self.worker << 12) | self.seq:019d}"
+
+    def many(self, n: int) -> List[str]:
+        with self.lock:
+            if self.pid != os.getpid():  # first use, or forked after import
+                self.pid, self.worker, self.last_ms, self.seq = os.getpid(), self._worker(), 0, 0
+            return [self._next() for _ in range(n)]
+
+    def __call__(self) -> str:
+        return self.many(1)[0]
+
+new_id = IdGenerator(ID_WORKER_BASE, ID_SLOT_DIR)
+
+# -------------------------------------------------
+# Minimal stores
+# -------------------------------------------------
+# Passwords are stored as "scrypt$<salt hex>$<key hex>", never in clear.
+def hash_password(password: str) -> str:
+    salt = os.urandom(16)
+    key = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=2**14, r=8, p=1, dklen=32)
+    return f"scrypt${salt.hex()}${key.hex()}"
+
+def check_password(user: Dict[str, Any], password: str) -> bool:
+    try:
+        _, salt, key = user.get("password_hash", "").split("$")
+    except ValueError:
+        return False
+    got = hashlib.scrypt(password.encode("utf-8"), salt=bytes.fromhex(salt), n=2**14, r=8, p=1, dklen=32)
+    return hmac.compare_digest(got.hex(), key)
+
+USERS = table("users", key="username")
+for _u in USERS.all():
+    if "password" in _u:  # rows written before hashing
+        USERS.put({"username": _u["username"], "password_hash": hash_password(_u.pop("password")), "role": _u.get("role", "user")})
+_admin = USERS.get(ADMIN_USER)
+if not _admin or _admin.get("role") != "admin" or not check_password(_admin, ADMIN_PASS):
+    USERS.put({"username": ADMIN_USER, "password_hash": hash_password(ADMIN_PASS), "role": "admin"})
 
 RECIPES: List[Dict[str, Any]] = []
-KNOWLEDGE: List[Dict[str, Any]] = []
+
+# -------------------------------------------------
+# Content-addressed blobs (identical uploads are stored once)
+# -------------------------------------------------
+INGEST_BLOCK_BYTES = 64 * 1024
+
+def _stream_digest(f) -> tuple:
+    # sha256 hex + size of a seekable stream, read block by block; rewinds f afterwards
+    h, size = hashlib.sha256(), 0
+    while True:
+        block = f.read(INGEST_BLOCK_BYTES)
+        if not block:
+            break
+        h.update(block); size += len(block)
+    f.seek(0)
+    return h.hexdigest(), size
+
+# Upload payloads live on disk as BLOB_DIR/<sha[:2]>/<sha256>. They are copied block by block into
+# a temp file while being hashed, then renamed into place, so any size streams through a fixed
+# buffer and a file is never visible half-written. Tables only keep the digest and metadata.
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(DATA_DIR, "blobs") if DATA_DIR else "")
+BLOB_BLOCK_BYTES = 1024 * 1024
+
+class BlobStore:
+    def __init__(self, root: str):
+        self.root = root or tempfile.mkdtemp(prefix="hexcarb-blobs-")
+        self.tmp = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp, exist_ok=True)
+
+    def path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha)
+
+    def __contains__(self, sha: str) -> bool:
+        return os.path.exists(self.path(sha))
+
+    def adopt(self, tmp: str, sha: str) -> bool:
+        # move a complete file (under self.tmp) into place as blob `sha` -> duplicate
+        dst = self.path(sha)
+        if os.path.exists(dst):
+            os.unlink(tmp)
+            return True
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(tmp, dst)
+        return False
+
+    def put(self, f) -> tuple:
+        # -> (sha256 hex, size, duplicate) for everything left in stream f
+        h, size = hashlib.sha256(), 0
+        fd, tmp = tempfile.mkstemp(dir=self.tmp)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    block = f.read(BLOB_BLOCK_BYTES)
+                    if not block:
+                        break
+                    h.update(block); size += len(block)
+                    out.write(block)
+                out.flush(); os.fsync(out.fileno())
+            sha = h.hexdigest()
+            duplicate = self.adopt(tmp, sha)
+            tmp = None
+            return sha, size, duplicate
+        finally:
+            if tmp:
+                os.unlink(tmp)
+
+BLOB_STORE = BlobStore(BLOB_DIR)
+
+# -------------------------------------------------
+# Knowledge store (tokenized, positional, segment-based)
+# -------------------------------------------------
+# Documents are cut into overlapping chunks; each chunk is the unit of indexing.
+# Chunks get global ids in ingest order and live in append-only segments.
+# In-memory segments (KnowledgeIndex) are flushed to immutable on-disk segments (DiskSegment)
+# whose arrays are mmap'ed, so startup maps files instead of re-parsing them.
+# Once KNOWLEDGE_MERGE_FACTOR trailing segments share a level, they are merged
+# into one segment of the next level. That keeps the segment count logarithmic.
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+def _tokens(text: str):
+    # (lowercased token, char offset in the original text)
+    for m in _TOKEN_RE.finditer(text):
+        yield m.group().lower(), m.start()
+
+def _char_offset(text: str, pos: int) -> int:
+    for k, (_, off) in enumerate(_tokens(text)):
+        if k == pos:
+            return off
+    return 0
+
+KNOWLEDGE_DIR = os.path.join(DATA_DIR, "knowledge") if DATA_DIR else ""  # "" -> in-memory only
+KNOWLEDGE_PAGE_MAX = int(os.getenv("KNOWLEDGE_PAGE_MAX", "100"))
+KNOWLEDGE_CHUNK_CHARS = int(os.getenv("KNOWLEDGE_CHUNK_CHARS", "2000"))
+KNOWLEDGE_CHUNK_OVERLAP = int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP", "200"))
+KNOWLEDGE_FLUSH_CHUNKS = int(os.getenv("KNOWLEDGE_FLUSH_CHUNKS", "4096"))
+KNOWLEDGE_MERGE_FACTOR = int(os.getenv("KNOWLEDGE_MERGE_FACTOR", "8"))
+BM25_K1, BM25_B = 1.2, 0.75
+
+def _iter_text_chunks(f, size: int = KNOWLEDGE_CHUNK_CHARS, overlap: int = KNOWLEDGE_CHUNK_OVERLAP):
+    # Decode a binary stream block by block and yield overlapping (chunk, new chars) pairs;
+    # at most one block plus one chunk is held in memory at a time.
+    overlap = max(0, min(overlap, size // 4))
+    dec = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    buf, carried = "", 0  # carried = leading chars of buf already emitted in the previous chunk
+    while True:
+        block = f.read(INGEST_BLOCK_BYTES)
+        buf += dec.decode(block, final=not block)
+        while len(buf) >= size:
+            # prefer to cut on whitespace near the end of the window
+            ws = max(buf.rfind(" ", size - overlap, size), buf.rfind("\n", size - overlap, size))
+            cut = ws if ws > overlap else size
+            yield buf[:cut], cut - carried
+            buf, carried = buf[cut - overlap:], overlap
+        if not block:
+            break
+    if len(buf) > carried and buf[carried:].strip():
+        yield buf, len(buf) - carried
+
+# Every segment exposes: base, level, n_chunks, total_tokens, docs,
+# postings(term) -> {local chunk id: [token positions]} | None,
+# chunk_len/chunk_text/chunk_doc(local id), iter_chunks(), iter_terms().
+class KnowledgeIndex:
+    # mutable in-memory segment; also the whole store when KNOWLEDGE_DIR is unset
+    def __init__(self, base: int = 0, level: int = 0):
+        self.base, self.level = base, level
+        self.postings: Dict[str, Dict[int, List[int]]] = {}  # term -> {local chunk id: [token positions]}
+        self.texts: List[str] = []
+        self.lens = array("I")      # tokens per chunk
+        self.doc_of = array("I")    # chunk -> position in self.docs
+        self.docs: List[Dict[str, Any]] = []
+        self.total_tokens = 0
+
+    @property
+    def n_chunks(self) -> int:
+        return len(self.texts)
+
+    def add(self, doc: Dict[str, Any], text: str, doc_ord: Optional[int] = None) -> int:
+        if doc_ord is None:
+            if not self.docs or self.docs[-1] is not doc:
+                self.docs.append(doc)
+            doc_ord = len(self.docs) - 1
+        local = len(self.texts)
+        n = 0
+        for n, (tok, _) in enumerate(_tokens(text), start=1):
+            self.postings.setdefault(tok, {}).setdefault(local, []).append(n - 1)
+        self.texts.append(text)
+        self.lens.append(n)
+        self.doc_of.append(doc_ord)
+        self.total_tokens += n
+        return self.base + local
+
+    def postings_for(self, term: str) -> Optional[Dict[int, List[int]]]:
+        return self.postings.get(term)
+
+    def chunk_len(self, local: int) -> int:
+        return self.lens[local]
+
+    def chunk_text(self, local: int) -> str:
+        return self.texts[local]
+
+    def chunk_doc(self, local: int) -> Dict[str, Any]:
+        return self.docs[self.doc_of[local]]
+
+    def iter_chunks(self):
+        for local, text in enumerate(self.texts):
+            yield text, self.lens[local], self.doc_of[local]
+
+    def iter_terms(self):
+        for term in sorted(self.postings):
+            p = self.postings[term]
+            yield term, [(i, p[i]) for i in sorted(p)]
+
+    def absorb(self, seg) -> None:
+        # append another segment that starts where this one ends
+        shift, doc_shift = self.n_chunks, len(self.docs)
+        if self.docs and seg.docs and self.docs[-1]["id"] == seg.docs[0]["id"]:
+            doc_shift -= 1  # document split across the two segments
+            self.docs.extend(seg.docs[1:])
+        else:
+            self.docs.extend(seg.docs)
+        for text, n, doc_ord in seg.iter_chunks():
+            self.texts.append(text); self.lens.append(n); self.doc_of.append(doc_ord + doc_shift)
+            self.total_tokens += n
+        for term, plist in seg.iter_terms():
+            dst = self.postings.setdefault(term, {})
+            for i, pos in plist:
+                dst[i + shift] = list(pos)
+
+    def write(self, path: str) -> None:
+        w = _SegmentWriter(path)
+        for text, n, doc_ord in self.iter_chunks():
+            w.add_chunk(text, n, doc_ord)
+        for term, plist in self.iter_terms():
+            w.add_term(term, plist)
+        w.close(self.base, self.level, self.docs)
+
+# On-disk segment layout (one directory per segment, raw little-endian arrays):
+#   meta.json                     base, level, n_chunks, n_terms, total_tokens
+#   docs.json                     document metadata, loaded on first use
+#   text.bin / text.off (i64)     utf-8 chunk texts and their n+1 byte offsets
+#   chunk.len / chunk.doc (u32)   tokens per chunk, chunk -> docs.json position
+#   terms.bin / terms.off (i64)   sorted utf-8 terms and their T+1 byte offsets
+#   terms.post (i64)              T+1 offsets into post.ids
+#   post.ids (u32)                local chunk ids, ascending within a term
+#   post.pos (i64)                P+1 offsets into pos.u32, one per posting
+#   pos.u32 (u32)                 token positions
+class _SegmentWriter:
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.f = {name: open(os.path.join(path, name), "wb") for name in
+                  ("text.bin", "text.off", "chunk.len", "chunk.doc", "terms.bin", "terms.off",
+                   "terms.post", "post.ids", "post.pos", "pos.u32")}
+        self.text_off = self.term_off = self.n_post = self.n_pos = 0
+        self.n_chunks = self.n_terms = self.total_tokens = 0
+        for name in ("text.off", "terms.off", "terms.post", "post.pos"):
+            self.f[name].write(array("q", [0]).tobytes())
+
+    def add_chunk(self, text: str, n_tokens: int, doc_ord: int) -> None:
+        b = text.encode("utf-8")
+        self.f["text.bin"].write(b)
+        self.text_off += len(b)
+        self.f["text.off"].write(array("q", [self.text_off]).tobytes())
+        self.f["chunk.len"].write(array("I", [n_tokens]).tobytes())
+        self.f["chunk.doc"].write(array("I", [doc_ord]).tobytes())
+        self.n_chunks += 1
+        self.total_tokens += n_tokens
+
+    def add_term(self, term: str, plist) -> None:
+        b = term.encode("utf-8")
+        self.f["terms.bin"].write(b)
+        self.term_off += len(b)
+        self.f["terms.off"].write(array("q", [self.term_off]).tobytes())
+        ids, pos_off, pos = array("I"), array("q"), array("I")
+        for i, positions in plist:
+            ids.append(i)
+            pos.extend(positions)
+            pos_off.append(self.n_pos + len(pos))
+        self.f["post.ids"].write(ids.tobytes())
+        self.f["post.pos"].write(pos_off.tobytes())
+        self.f["pos.u32"].write(pos.tobytes())
+        self.n_post += len(ids); self.n_pos += len(pos)
+        self.f["terms.post"].write(array("q", [self.n_post]).tobytes())
+        self.n_terms += 1
+
+    def close(self, base: int, level: int, docs: List[Dict[str, Any]]) -> None:
+        for fh in self.f.values():
+            fh.close()
+        with open(os.path.join(self.path, "docs.json"), "w") as fh:
+            json.dump(docs, fh)
+        meta = {"base": base, "level": level, "n_chunks": self.n_chunks,
+                "n_terms": self.n_terms, "total_tokens": self.total_tokens}
+        with open(os.path.join(self.path, "meta.json"), "w") as fh:
+            json.dump(meta, fh)
+
+def _map(path: str, dtype):
+    # zero-length files cannot be mmap'ed
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+class DiskSegment:
+    # immutable, mmap-backed segment; opening it reads meta.json and docs.json and maps the
+    # rest, so an open segment keeps working after a merge deletes its directory
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as fh:
+            meta = json.load(fh)
+        self.base, self.level = meta["base"], meta["level"]
+        self.n_chunks, self.n_terms, self.total_tokens = meta["n_chunks"], meta["n_terms"], meta["total_tokens"]
+        p = lambda name: os.path.join(path, name)
+        self.text, self.text_off = _map(p("text.bin"), np.uint8), _map(p("text.off"), np.int64)
+        self.lens, self.doc_of = _map(p("chunk.len"), np.uint32), _map(p("chunk.doc"), np.uint32)
+        self.terms, self.term_off = _map(p("terms.bin"), np.uint8), _map(p("terms.off"), np.int64)
+        self.term_post = _map(p("terms.post"), np.int64)
+        self.post_ids, self.post_pos = _map(p("post.ids"), np.uint32), _map(p("post.pos"), np.int64)
+        self.pos = _map(p("pos.u32"), np.uint32)
+        with open(p("docs.json")) as fh:
+            self.docs: List[Dict[str, Any]] = json.load(fh)
+
+    def _term(self, t: int) -> bytes:
+        return self.terms[self.term_off[t]:self.term_off[t + 1]].tobytes()
+
+    def _find(self, term: str) -> int:
+        key, lo, hi = term.encode("utf-8"), 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_terms and self._term(lo) == key else -1
+
+    def _plist(self, t: int) -> List[tuple]:
+        a, b = int(self.term_post[t]), int(self.term_post[t + 1])
+        offs = self.post_pos[a:b + 1].tolist()
+        return [(i, self.pos[offs[j]:offs[j + 1]].tolist()) for j, i in enumerate(self.post_ids[a:b].tolist())]
+
+    def postings_for(self, term: str) -> Optional[Dict[int, List[int]]]:
+        t = self._find(term)
+        return dict(self._plist(t)) if t >= 0 else None
+
+    def chunk_len(self, local: int) -> int:
+        return int(self.lens[local])
+
+    def chunk_text(self, local: int) -> str:
+        return self.text[self.text_off[local]:self.text_off[local + 1]].tobytes().decode("utf-8")
+
+    def chunk_doc(self, local: int) -> Dict[str, Any]:
+        return self.docs[int(self.doc_of[local])]
+
+    def iter_chunks(self):
+        for local in range(self.n_chunks):
+            yield self.chunk_text(local), int(self.lens[local]), int(self.doc_of[local])
+
+    def iter_terms(self):
+        for t in range(self.n_terms):
+            yield self._term(t).decode("utf-8"), self._plist(t)
+
+def _merge_to_disk(segs: List[Any], path: str) -> None:
+    # stream-merge adjacent segments: chunks are concatenated, term lists k-way merged
+    w = _SegmentWriter(path)
+    docs: List[Dict[str, Any]] = []
+    shifts = []
+    for s in segs:
+        doc_shift = len(docs)
+        if docs and s.docs and docs[-1]["id"] == s.docs[0]["id"]:
+            doc_shift -= 1
+            docs.extend(s.docs[1:])
+        else:
+            docs.extend(s.docs)
+        for text, n, doc_ord in s.iter_chunks():
+            w.add_chunk(text, n, doc_ord + doc_shift)
+        shifts.append(s.base - segs[0].base)
+    def tagged(k, s):
+        for term, plist in s.iter_terms():
+            yield term, k, plist
+    streams = [tagged(k, s) for k, s in enumerate(segs)]
+    cur, merged = None, []
+    for term, k, plist in heapq.merge(*streams, key=lambda e: (e[0], e[1])):
+        if term != cur:
+            if cur is not None:
+                w.add_term(cur, merged)
+            cur, merged = term, []
+        merged.extend((i + shifts[k], pos) for i, pos in plist)
+    if cur is not None:
+        w.add_term(cur, merged)
+    w.close(segs[0].base, segs[0].level + 1, docs)
+
+class KnowledgeStore:
+    # Single writer (guarded by a thread lock plus an fcntl lock file across workers),
+    # lock-free readers. Each reader works on a snapshot of the segment list, which a
+    # writer only ever replaces, never mutates.
+    def __init__(self, root: str = ""):
+        self.root = root
+        self.lock = threading.Lock()
+        self.segments: List[Any] = []
+        self.docs = 0
+        self.next_seg = 0
+        self._manifest_mtime = None
+        self.by_digest: Dict[str, Dict[str, Any]] = {}  # sha256 -> doc, see _digests()
+        self.aliases: Dict[tuple, Dict[str, Any]] = {}  # (sha256, name) -> entry pointing at an indexed doc
+        self._digest_pos = 0
+        if root:
+            os.makedirs(root, exist_ok=True)
+            self._load()
+
+    def __len__(self) -> int:
+        self._refresh()
+        return self.docs
+
+    # ---- manifest ----
+    def _manifest_path(self) -> str:
+        return os.path.join(self.root, "manifest.json")
+
+    def _load(self) -> None:
+        opened = {os.path.basename(s.path): s for s in self.segments}
+        for attempt in range(5):
+            try:
+                with open(self._manifest_path()) as fh:
+                    manifest = json.load(fh)
+                self._manifest_mtime = os.stat(self._manifest_path()).st_mtime_ns
+            except FileNotFoundError:
+                manifest = {"segments": [], "docs": 0, "next_seg": 0}
+            try:
+                segments = [opened.get(n) or DiskSegment(os.path.join(self.root, n)) for n in manifest["segments"]]
+                break
+            except FileNotFoundError:
+                # a merge in another worker saved a newer manifest and removed these segments
+                if attempt == 4:
+                    raise
+        self.segments = segments
+        self.docs, self.next_seg = manifest["docs"], manifest["next_seg"]
+
+    def _refresh(self) -> None:
+        # pick up segments committed by other workers (one stat per call)
+        if not self.root:
+            return
+        try:
+            mtime = os.stat(self._manifest_path()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._manifest_mtime:
+            self._load()
+
+    def _save(self) -> None:
+        manifest = {"segments": [os.path.basename(s.path) for s in self.segments],
+                    "docs": self.docs, "next_seg": self.next_seg}
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(manifest, fh); fh.flush(); os.fsync(fh.fileno())
+        os.replace(tmp, self._manifest_path())
+        self._manifest_mtime = os.stat(self._manifest_path()).st_mtime_ns
+
+    def _seg_path(self) -> str:
+        while True:  # skip names left behind by a crash between rename and manifest save
+            self.next_seg += 1
+            path = os.path.join(self.root, f"seg-{self.next_seg:06d}")
+            if not os.path.exists(path):
+                return path
+
+    # ---- writes ----
+    def _commit(self, mem: KnowledgeIndex) -> None:
+        if mem.n_chunks:
+            if self.root:
+                path = self._seg_path()
+                mem.write(path + ".tmp"); os.replace(path + ".tmp", path)
+                seg = DiskSegment(path)
+            else:
+                seg = mem
+            self.segments = self.segments + [seg]
+        self._maybe_merge()
+
+    def _maybe_merge(self) -> None:
+        f = KNOWLEDGE_MERGE_FACTOR
+        while f > 1 and len(self.segments) >= f and len({s.level for s in self.segments[-f:]}) == 1:
+            tail = self.segments[-f:]
+            if self.root:
+                path = self._seg_path()
+                _merge_to_disk(tail, path + ".tmp"); os.replace(path + ".tmp", path)
+                merged = DiskSegment(path)
+            else:
+                merged = KnowledgeIndex(base=tail[0].base, level=tail[0].level + 1)
+                for s in tail:
+                    merged.absorb(s)
+            self.segments = self.segments[:-f] + [merged]
+            if self.root:
+                self._save()
+                for s in tail:
+                    shutil.rmtree(s.path, ignore_errors=True)
+
+    def _digests(self) -> Dict[str, Dict[str, Any]]:
+        # sha256 -> doc; the on-disk log is append-only, so only new lines are read
+        if self.root:
+            try:
+                with open(os.path.join(self.root, "digests.jsonl"), "rb") as fh:
+                    fh.seek(self._digest_pos)
+                    for line in fh:
+                        if line.endswith(b"\n"):
+                            doc = json.loads(line)
+                            if doc.get("ref"):
+                                self.aliases[(doc["sha256"], doc["name"])] = doc
+                            else:
+                                self.by_digest[doc["sha256"]] = doc
+                            self._digest_pos += len(line)
+            except FileNotFoundError:
+                pass
+        return self.by_digest
+
+    def ingest(self, name: str, f) -> Dict[str, Any]:
+        # -> doc metadata; a payload seen before is not re-indexed: a new name for it is
+        # recorded as an entry whose "ref" points at the doc that holds the chunks
+        sha, size = _stream_digest(f)
+        with self.lock, _FileLock(os.path.join(self.root, "LOCK") if self.root else ""):
+            self._refresh()
+            known = self._digests().get(sha)
+            if known:
+                if known["name"] == name:
+                    return dict(known, duplicate=True)
+                alias = self.aliases.get((sha, name))
+                if alias:
+                    return dict(alias, duplicate=True)
+                alias = {"id": new_id(), "name": name, "len": known["len"], "chunks": known["chunks"],
+                         "sha256": sha, "size": size, "ref": known["id"]}
+                self._log_digest(alias)
+                self.aliases[(sha, name)] = alias
+                return dict(alias, duplicate=True, created=True)
+            doc = {"id": new_id(), "name": name, "len": 0, "chunks": 0, "sha256": sha, "size": size}
+            base = sum(s.n_chunks for s in self.segments)
+            mem = KnowledgeIndex(base=base)
+            for text, fresh in _iter_text_chunks(f):
+                mem.add(doc, text)
+                doc["len"] += fresh; doc["chunks"] += 1
+                if mem.n_chunks >= KNOWLEDGE_FLUSH_CHUNKS:
+                    self._commit(mem)
+                    mem = KnowledgeIndex(base=mem.base + mem.n_chunks)
+            self._commit(mem)
+            self.docs += 1
+            if self.root:
+                self._save()
+            self._log_digest(doc)
+            self.by_digest[sha] = doc
+            return doc
+
+    def _log_digest(self, doc: Dict[str, Any]) -> None:
+        # append to the digest log and skip past our own line, so _digests() doesn't re-read it
+        if self.root:
+            line = (json.dumps(doc) + "\n").encode()
+            with open(os.path.join(self.root, "digests.jsonl"), "ab") as fh:
+                fh.write(line)
+                end = fh.tell()
+            if self._digest_pos == end - len(line):
+                self._digest_pos = end
+
+    # ---- reads ----
+    @property
+    def n_chunks(self) -> int:
+        return sum(s.n_chunks for s in self.segments)
+
+    def _locate(self, gid: int) -> tuple:
+        # global chunk id -> (segment, local id)
+        segs = self.segments
+        s = segs[bisect.bisect_right([x.base for x in segs], gid) - 1]
+        return s, gid - s.base
+
+    def chunk_text(self, gid: int) -> str:
+        s, local = self._locate(gid)
+        return s.chunk_text(local)
+
+    def chunk_doc(self, gid: int) -> Dict[str, Any]:
+        s, local = self._locate(gid)
+        return s.chunk_doc(local)
+
+    def search(self, q: str, k: int) -> List[tuple]:
+        # best k docs containing q as a token phrase, BM25-ranked on their best chunk
+        # -> [(score, doc, chunk text, char offset of first match)];
+        # cost is bounded by the query terms' postings, walked from the rarest one
+        self._refresh()
+        terms = [t for t, _ in _tokens(q or "")]
+        segs = self.segments
+        n_chunks = sum(s.n_chunks for s in segs)
+        if not terms or k <= 0 or not n_chunks:
+            return []
+        per_seg = [[s.postings_for(t) for t in terms] for s in segs]
+        df = [sum(len(lists[j] or ()) for lists in per_seg) for j in range(len(terms))]
+        if not all(df):
+            return []
+        avgdl = sum(s.total_tokens for s in segs) / n_chunks or 1.0
+        idf = [math.log(1 + (n_chunks - d + 0.5) / (d + 0.5)) for d in df]
+        best: Dict[str, tuple] = {}  # doc id -> (score, seg index, local chunk id, pos) of its best chunk
+        for si, (s, lists) in enumerate(zip(segs, per_seg)):
+            if not all(lists):
+                continue
+            rarest = min(range(len(lists)), key=lambda j: len(lists[j]))
+            for local in lists[rarest]:
+                if not all(local in p for p in lists):
+                    continue
+                pos = _phrase_start(local, lists)
+                if pos is None:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * s.chunk_len(local) / avgdl)
+                score = 0.0
+                for w, p in zip(idf, lists):
+                    tf = len(p[local])
+                    score += w * tf * (BM25_K1 + 1) / (tf + norm)
+                doc_id = s.chunk_doc(local)["id"]
+                if doc_id not in best or score > best[doc_id][0]:
+                    best[doc_id] = (score, si, local, pos)
+        out = []
+        for score, si, local, pos in heapq.nlargest(k, best.values()):
+            text = segs[si].chunk_text(local)
+            out.append((score, segs[si].chunk_doc(local), text, _char_offset(text, pos)))
+        return out
+
+def _phrase_start(local: int, lists: List[Dict[int, List[int]]]) -> Optional[int]:
+    if len(lists) == 1:
+        return lists[0][local][0]
+    rest = [set(p[local]) for p in lists[1:]]
+    for p0 in lists[0][local]:
+        if all(p0 + k + 1 in s for k, s in enumerate(rest)):
+            return p0
+    return None
+
+class _FileLock:
+    # exclusive advisory lock across processes; no-op without a path or fcntl
+    def __init__(self, path: str):
+        self.path, self.fh = path, None
+
+    def __enter__(self):
+        if self.path and fcntl is not None:
+            self.fh = open(self.path, "a")
+            fcntl.flock(self.fh, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fh:
+            fcntl.flock(self.fh, fcntl.LOCK_UN); self.fh.close(); self.fh = None
+
+KNOWLEDGE = KnowledgeStore(KNOWLEDGE_DIR)
+
+# -------------------------------------------------
+# Semantic search (hashed TF-IDF -> truncated SVD, CPU only)
+# -------------------------------------------------
+# Each chunk gets a dense float32 vector: sublinear tf * idf over feature-hashed tokens,
+# projected onto the top SEMANTIC_DIM right singular vectors of a sample of chunks
+# (randomized SVD) and L2-normalized. Vectors are rows of one contiguous matrix indexed by
+# global chunk id, so a query is a single mat-vec plus argpartition. Chunks ingested after
+# the model was fit are folded in with the same projection by a background thread started
+# on ingest (or by a query that finds the index behind); queries never embed the corpus.
+SEMANTIC_DIM = int(os.getenv("SEMANTIC_DIM", "128"))
+SEMANTIC_HASH_DIM = 1 << 14
+SEMANTIC_FIT_SAMPLE = int(os.getenv("SEMANTIC_FIT_SAMPLE", "20000"))
+SEMANTIC_BATCH = 512
+
+class SemanticIndex:
+    def __init__(self, store: KnowledgeStore, root: str = ""):
+        self.store, self.root = store, root
+        self.lock = threading.Lock()
+        self.components: Optional[np.ndarray] = None  # (dim, SEMANTIC_HASH_DIM)
+        self.idf: Optional[np.ndarray] = None         # (SEMANTIC_HASH_DIM,)
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self._buf = self.vectors  # memory mode: self.vectors is a prefix view of this, grown by doubling
+        self._buckets: Dict[str, int] = {}
+        self._mtime = None
+        self._fitting: Optional[threading.Thread] = None
+        self._fitting_lock = threading.Lock()
+        if root:
+            os.makedirs(root, exist_ok=True)
+            self._load()
+
+    # ---- features ----
+    def _bucket(self, tok: str) -> int:
+        b = self._buckets.get(tok)
+        if b is None:
+            b = self._buckets[tok] = zlib.crc32(tok.encode("utf-8")) % SEMANTIC_HASH_DIM
+        return b
+
+    def _sparse(self, text: str) -> tuple:
+        counts: Dict[int, int] = {}
+        for tok, _ in _tokens(text):
+            b = self._bucket(tok)
+            counts[b] = counts.get(b, 0) + 1
+        idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        return idx, tf
+
+    def _dense(self, rows: List[tuple]) -> np.ndarray:
+        X = np.zeros((len(rows), SEMANTIC_HASH_DIM), dtype=np.float32)
+        for r, (idx, tf) in enumerate(rows):
+            X[r, idx] = tf
+        X *= self.idf
+        X /= np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+        return X
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        V = self._dense([self._sparse(t) for t in texts]) @ self.components.T
+        V /= np.maximum(np.linalg.norm(V, axis=1, keepdims=True), 1e-12)
+        return V.astype(np.float32, copy=False)
+
+    # ---- persistence ----
+    def _paths(self) -> tuple:
+        return os.path.join(self.root, "model.npz"), os.path.join(self.root, "vectors.f32")
+
+    def _load(self) -> None:
+        model, vecs = self._paths()
+        try:
+            self._mtime = (os.stat(model).st_mtime_ns, os.path.getsize(vecs))
+            with np.load(model) as z:
+                self.components, self.idf = z["components"], z["idf"]
+        except FileNotFoundError:
+            return
+        dim = self.components.shape[0]
+        n = os.path.getsize(vecs) // (4 * dim)
+        self.vectors = np.memmap(vecs, dtype=np.float32, mode="r", shape=(n, dim)) if n else np.empty((0, dim), np.float32)
+
+    def _refresh(self) -> None:
+        if not self.root:
+            return
+        model, vecs = self._paths()
+        try:
+            mtime = (os.stat(model).st_mtime_ns, os.path.getsize(vecs))
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    # ---- build ----
+    def fit(self, only_if_missing: bool = False) -> Dict[str, Any]:
+        # (re)fit the projection on a sample of chunks and re-embed the whole corpus
+        t0 = time.time()
+        with self.lock, _FileLock(os.path.join(self.root, "LOCK") if self.root else ""):
+            if only_if_missing:
+                self._refresh()  # another worker may have fitted while we waited for the lock
+                if self.components is not None:
+                    return {"chunks": len(self.vectors), "dim": self.components.shape[0], "secs": 0.0}
+            store = self.store
+            store._refresh()
+            n = store.n_chunks
+            if not n:
+                return {"chunks": 0, "dim": 0, "secs": 0.0}
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(n, size=min(n, SEMANTIC_FIT_SAMPLE), replace=False))
+            rows = [self._sparse(store.chunk_text(int(g))) for g in sample]
+            df = np.zeros(SEMANTIC_HASH_DIM, dtype=np.float32)
+            for idx, _ in rows:
+                df[idx] += 1
+            self.idf = (np.log((1 + len(rows)) / (1 + df)) + 1).astype(np.float32)
+            dim = min(SEMANTIC_DIM, len(rows))
+            width = min(dim + 10, len(rows))
+            omega = rng.standard_normal((SEMANTIC_HASH_DIM, width)).astype(np.float32)
+            batches = [rows[i:i + SEMANTIC_BATCH] for i in range(0, len(rows), SEMANTIC_BATCH)]
+            Q, _ = np.linalg.qr(np.vstack([self._dense(b) @ omega for b in batches]))
+            B = np.zeros((width, SEMANTIC_HASH_DIM), dtype=np.float32)
+            for i, b in enumerate(batches):
+                B += Q[i * SEMANTIC_BATCH:(i + 1) * SEMANTIC_BATCH].T @ self._dense(b)
+            self.components = np.linalg.svd(B, full_matrices=False)[2][:dim].astype(np.float32)
+            self.vectors = np.empty((0, dim), dtype=np.float32)
+            if self.root:
+                model, vecs = self._paths()
+                open(vecs + ".tmp", "wb").close()
+                self._append(0, n, vecs + ".tmp")
+                np.savez(model + ".tmp.npz", components=self.components, idf=self.idf)
+                os.replace(vecs + ".tmp", vecs); os.replace(model + ".tmp.npz", model)
+                self._load()
+            else:
+                self._append(0, n)
+        return {"chunks": n, "dim": dim, "secs": round(time.time() - t0, 3)}
+
+    def _append(self, start: int, end: int, path: str = "") -> None:
+        if not path and (start == 0 or len(self._buf) < end):
+            buf = np.empty((max(end, 2 * len(self._buf)), self.components.shape[0]), dtype=np.float32)
+            buf[:start] = self.vectors[:start]
+            self._buf = buf
+        for i in range(start, end, SEMANTIC_BATCH):
+            V = self._embed([self.store.chunk_text(g) for g in range(i, min(end, i + SEMANTIC_BATCH))])
+            if path:
+                with open(path, "ab") as fh:
+                    fh.write(V.tobytes())
+            else:
+                # rows past len(self.vectors) are not visible to readers until the view grows
+                self._buf[i:i + len(V)] = V
+                self.vectors = self._buf[:i + len(V)]
+
+    def ready(self) -> bool:
+        # True once there is a model to search with; otherwise starts the background fit, so
+        # the (randomized SVD) fit never runs inside a search request
+        self._refresh()
+        if self.components is not None or not self.store.n_chunks:
+            return True
+        self.catch_up()
+        return False
+
+    def catch_up(self) -> None:
+        # start the background thread that fits (once) and folds in new chunks, unless running
+        with self._fitting_lock:
+            if self._fitting is None or not self._fitting.is_alive():
+                self._fitting = threading.Thread(target=self._work, daemon=True)
+                self._fitting.start()
+
+    def _work(self) -> None:
+        while True:
+            if self.components is None:
+                self.fit(only_if_missing=True)
+            else:
+                self._sync()
+            self._refresh()
+            if self.components is None or len(self.vectors) >= self.store.n_chunks:
+                return
+
+    def _sync(self) -> None:
+        # fold chunks ingested since the last fit/sync into the matrix
+        if self.components is None:
+            return
+        if len(self.vectors) >= self.store.n_chunks:
+            return
+        with self.lock, _FileLock(os.path.join(self.root, "LOCK") if self.root else ""):
+            self._refresh()
+            n = self.store.n_chunks
+            if len(self.vectors) < n:
+                self._append(len(self.vectors), n, self._paths()[1] if self.root else "")
+                if self.root:
+                    self._load()
+
+    # ---- query ----
+    def search(self, q: str, k: int) -> List[tuple]:
+        # best k docs by cosine similarity of their best chunk -> [(score, doc, chunk text, char offset)]
+        self.store._refresh(); self._refresh()
+        if not q or not q.strip() or k <= 0:
+            return []
+        vecs = self.vectors
+        if len(vecs) < self.store.n_chunks:
+            self.catch_up()  # chunks ingested since are searchable once the thread folds them in
+        if not len(vecs):
+            return []
+        scores = vecs @ self._embed([q])[0]
+        m = min(len(scores), 4 * k)  # headroom for several hits in the same doc
+        top = np.argpartition(-scores, m - 1)[:m]
+        top = top[np.argsort(-scores[top])]
+        out, seen = [], set()
+        qterms = {t for t, _ in _tokens(q)}
+        for g in top.tolist():
+            if scores[g] <= 0:
+                break  # nothing in common with the query
+            doc = self.store.chunk_doc(g)
+            if doc["id"] in seen:
+                continue
+            seen.add(doc["id"])
+            text = self.store.chunk_text(g)
+            off = next((o for t, o in _tokens(text) if t in qterms), 0)
+            out.append((float(scores[g]), doc, text, off))
+            if len(out) == k:
+                break
+        return out
+
+SEMANTIC = SemanticIndex(KNOWLEDGE, os.path.join(KNOWLEDGE_DIR, "semantic") if KNOWLEDGE_DIR else "")
 
 # Some sample data for KPIs/funding
 FUNDING = [{"source": "KSUM", "amount": 10000}, {"source": "Angel", "amount": 25000}]
 
 # -------------------------------------------------
-# Rate limiter (best-effort, per instance)
+# Rate limiter (per instance by default, shared across workers optionally)
 # -------------------------------------------------
-from collections import deque, defaultdict
+# Token bucket per client IP: holds up to RATE_LIMIT_PER_MIN + RATE_LIMIT_BURST requests
+# and refills at RATE_LIMIT_PER_MIN per minute. Only [tokens, last seen] is kept per key,
+# in LRU order. A key idle long enough to refill completely is indistinguishable from a new
+# one, so it is evicted, and the table never exceeds RATE_LIMIT_MAX_KEYS.
+#
+# RATE_LIMIT_BACKEND picks where the counters live:
+#   memory (default)          per process
+#   sqlite[:///path.db]       shared by workers on one host (sqlite:////dev/shm/rl.db for speed)
+#   redis://host:port/db      shared by instances (any server speaking the Redis protocol)
+# Shared backends hand out tokens in leases of up to RATE_LIMIT_LEASE per round trip, so
+# most requests are served from the worker's lease without touching the shared store.
+# A cold key leases a single token; the lease doubles only while the previous one ran out
+# before it expired, and tokens left in an expired lease are returned on the next trip.
+# If the shared store is unreachable, the worker falls back to its own in-process bucket.
+from collections import OrderedDict
+from urllib.parse import urlparse, urlencode
+from starlette.concurrency import run_in_threadpool
+
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_LEASE = int(os.getenv("RATE_LIMIT_LEASE", "5"))
+RATE_LIMIT_LEASE_TTL = 1.0  # seconds an unused lease stays valid
+
+class TokenBucket:
+    shared = False
+
+    def __init__(self, per_min: int = RATE_LIMIT_PER_MIN, burst: int = RATE_LIMIT_BURST,
+                 max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = max(per_min, 1) / 60.0
+        self.capacity = float(per_min + burst)
+        self.max_keys = max_keys
+        self.idle = self.capacity / self.rate  # seconds until an empty bucket is full again
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, last ts]
+
+    def take(self, key: str, now: float, n: int = 1) -> int:
+        # -> tokens granted (0..n)
+        b = self.buckets.get(key)
+        if b is None:
+            b = self.buckets[key] = [self.capacity, now]
+        else:
+            b[0] = min(self.capacity, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            self.buckets.move_to_end(key)
+        granted = min(n, int(b[0]))
+        b[0] -= granted
+        self._evict(now)
+        return granted
+
+    def _evict(self, now: float) -> None:
+        # drop up to two LRU keys per call: amortized O(1) and faster than keys arrive
+        for _ in range(2):
+            if not self.buckets:
+                return
+            key, b = next(iter(self.buckets.items()))
+            if len(self.buckets) > self.max_keys or now - b[1] >= self.idle:
+                self.buckets.popitem(last=False)
+            else:
+                return
+
+class _LeasedLimiter:
+    # local lease cache in front of a shared store; subclasses implement _acquire()
+    shared = True
+
+    def __init__(self, per_min: int = RATE_LIMIT_PER_MIN, burst: int = RATE_LIMIT_BURST,
+                 lease: int = RATE_LIMIT_LEASE):
+        self.per_min, self.burst, self.lease = per_min, burst, max(lease, 1)
+        self.leases: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, expires, denied, size, drawn at]
+        self.fallback = TokenBucket(per_min, burst)
+        self.lock = threading.Lock()
+
+    def take_leased(self, key: str, now: float) -> Optional[bool]:
+        # fast path, no I/O: True = spent a leased token, False = denied until the lease
+        # expires, None = ask the shared store
+        with self.lock:
+            l = self.leases.get(key)
+            if l is None or now >= l[1]:
+                return None
+            if l[0] >= 1:
+                l[0] -= 1
+                return True
+            return False if l[2] else None
+
+    def take(self, key: str, now: float, n: int = 1) -> int:
+        cached = self.take_leased(key, now)
+        if cached is not None:
+            return int(cached)
+        with self.lock:
+            l = self.leases.get(key)
+            size, refund, drawn = 1, 0, now
+            if l is not None and not l[2]:
+                if l[0] < 1 and now < l[1]:
+                    size = min(l[3] * 2, self.lease)  # spent before expiry: lease more next time
+                refund, drawn, l[0] = int(l[0]), l[4], 0
+        try:
+            granted = self._acquire(key, size, now, refund, drawn)
+        except Exception:
+            with self.lock:  # TokenBucket is not thread-safe; take() runs on threadpool threads
+                return self.fallback.take(key, now)
+        with self.lock:
+            # an empty grant is cached as a denial until a token can have been refilled
+            expires = now + (RATE_LIMIT_LEASE_TTL if granted else self._retry_after(now))
+            self.leases[key] = [max(granted - 1, 0), expires, not granted, max(granted, 1), now]
+            self.leases.move_to_end(key)
+            for _ in range(2):
+                k, l = next(iter(self.leases.items()))
+                if len(self.leases) > RATE_LIMIT_MAX_KEYS or l[1] <= now:
+                    self.leases.popitem(last=False)
+                else:
+                    break
+        return 1 if granted else 0
+
+    def _retry_after(self, now: float) -> float:
+        return 60.0 / max(self.per_min, 1)
+
+    def _acquire(self, key: str, n: int, now: float, refund: int = 0, drawn: float = 0.0) -> int:
+        # -> tokens granted (0..n), after returning `refund` unused tokens leased at `drawn`
+        raise NotImplementedError
+
+class SQLiteLimiter(_LeasedLimiter):
+    # token buckets in one SQLite table (WAL), updated in a single IMMEDIATE transaction
+    def __init__(self, path: str, **kw):
+        super().__init__(**kw)
+        self.path = path
+        self.rate = max(self.per_min, 1) / 60.0
+        self.capacity = float(self.per_min + self.burst)
+        self.local = threading.local()
+        self.calls = 0
+        self._conn().execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, ts REAL) WITHOUT ROWID")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # counters, not records: durability is not needed
+            self.local.conn = conn
+        return conn
+
+    def _acquire(self, key: str, n: int, now: float, refund: int = 0, drawn: float = 0.0) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, ts FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + refund + (now - row[1]) * self.rate)
+            granted = min(n, int(tokens))
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, ts) VALUES (?, ?, ?)", (key, tokens - granted, now))
+            self.calls += 1
+            if self.calls % 1000 == 0:  # sweep keys that have fully refilled
+                conn.execute("DELETE FROM buckets WHERE ts < ?", (now - self.capacity / self.rate,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return granted
+
+class _Resp:
+    # minimal pipelining client for the Redis protocol (RESP2)
+    def __init__(self, url: str, timeout: float = 0.5):
+        u = urlparse(url)
+        self.addr = (u.hostname or "127.0.0.1", u.port or 6379)
+        self.password, self.db = u.password, int((u.path or "/0").lstrip("/") or 0)
+        self.timeout = timeout
+        self.sock, self.rfile = None, None
+        self.lock = threading.Lock()
+
+    def _connect(self) -> None:
+        self.sock = socket.create_connection(self.addr, timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile("rb")
+        setup = ([["AUTH", self.password]] if self.password else []) + ([["SELECT", self.db]] if self.db else [])
+        if setup:
+            self._roundtrip(setup)
+
+    @staticmethod
+    def _encode(cmd: List[Any]) -> bytes:
+        out = [b"*%d\r\n" % len(cmd)]
+        for arg in cmd:
+            b = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+        return b"".join(out)
+
+    def _read(self):
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else self.rfile.read(n + 2)[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise ConnectionError(f"bad redis reply: {line!r}")
+
+    def _roundtrip(self, cmds: List[List[Any]]) -> List[Any]:
+        self.sock.sendall(b"".join(self._encode(c) for c in cmds))
+        return [self._read() for _ in cmds]
+
+    def pipeline(self, cmds: List[List[Any]]) -> List[Any]:
+        with self.lock:
+            try:
+                if self.sock is None:
+                    self._connect()
+                return self._roundtrip(cmds)
+            except Exception:
+                if self.sock is not None:
+                    self.sock.close()
+                self.sock = self.rfile = None
+                raise
+
+class RedisLimiter(_LeasedLimiter):
+    # fixed 60 s windows of RATE_LIMIT_PER_MIN + RATE_LIMIT_BURST, one pipelined INCRBY+EXPIRE per lease
+    def __init__(self, url: str, **kw):
+        super().__init__(**kw)
+        self.client = _Resp(url)
+        self.limit = self.per_min + self.burst
+
+    def _retry_after(self, now: float) -> float:
+        return 60.0 - now % 60.0  # next window
+
+    def _acquire(self, key: str, n: int, now: float, refund: int = 0, drawn: float = 0.0) -> int:
+        window = int(now // 60)
+        if int(drawn // 60) != window:
+            refund = 0  # leased from a window that is already over
+        rkey = f"rl:{key}:{window}"
+        count, _ = self.client.pipeline([["INCRBY", rkey, n - refund], ["EXPIRE", rkey, 120]])
+        granted = max(0, min(n, self.limit - (count - n)))
+        if granted < n:  # only charge the window for what was granted
+            self.client.pipeline([["DECRBY", rkey, n - granted]])
+        return granted
+
+def make_limiter(spec: str = RATE_LIMIT_BACKEND):
+    if spec.startswith("redis://") or spec.startswith("rediss://"):
+        return RedisLimiter(spec)
+    if spec.startswith("sqlite"):
+        path = spec[len("sqlite:///"):] if spec.startswith("sqlite:///") else ""  # 4 slashes = absolute
+        if not path:
+            path = os.path.join(DATA_DIR or "/tmp", "ratelimit.db")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return SQLiteLimiter(path)
+    return TokenBucket()
 
 class RateLimiter(BaseHTTPMiddleware):
     def __init__(self, app):
         super().__init__(app)
-        self.hits = defaultdict(deque)
+        self.backend = make_limiter()
 
     async def dispatch(self, request: Request, call_next):
         ip = (request.client.host if request.client else "unknown") or "unknown"
         now = time.time()
-        window = 60.0  # seconds
-
-        dq = self.hits[ip]
-        dq.append(now)
-        # prune old
-        while dq and now - dq[0] > window:
-            dq.popleft()
-
-        if len(dq) > (RATE_LIMIT_PER_MIN + RATE_LIMIT_BURST):
+        b = self.backend
+        if b.shared:
+            allowed = b.take_leased(ip, now)
+            if allowed is None:
+                allowed = await run_in_threadpool(b.take, ip, now)
+        else:
+            allowed = b.take(ip, now)
+        if not allowed:
             return JSONResponse({"detail": "Too Many Requests"}, status_code=429)
-
         return await call_next(request)
 
 app.add_middleware(RateLimiter)
@@ -93,17 +1744,57 @@ def decode_access_token(token: str) -> Dict[str, Any]:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# Verified-token cache: token -> (user, exp). A repeat token costs one dict hit plus a USERS
+# version read instead of an HMAC check plus a USERS lookup. Entries die with the token's exp
+# claim, are dropped whenever /admin/users changes or deletes their user, and the whole cache
+# is flushed when the USERS version moves, which catches changes made through other workers.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+_TOKEN_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_TOKENS_BY_USER: Dict[str, set] = {}
+_TOKEN_LOCK = threading.Lock()
+_TOKEN_USERS_V: Optional[str] = None  # USERS version the cached entries were read under
+
+def _cache_token(token: str, user: Dict[str, Any], exp: float, users_v: str) -> None:
+    with _TOKEN_LOCK:
+        if users_v != _TOKEN_USERS_V:
+            return  # USERS changed while this token was being checked
+        _TOKEN_CACHE[token] = (user, exp)
+        _TOKENS_BY_USER.setdefault(user["username"], set()).add(token)
+        while len(_TOKEN_CACHE) > TOKEN_CACHE_SIZE:
+            old, (u, _) = _TOKEN_CACHE.popitem(last=False)
+            _TOKENS_BY_USER.get(u["username"], set()).discard(old)
+
+def invalidate_user_tokens(username: str) -> None:
+    with _TOKEN_LOCK:
+        for token in _TOKENS_BY_USER.pop(username, ()):
+            _TOKEN_CACHE.pop(token, None)
+
 def get_current_user(authorization: str = Header(default="")) -> Dict[str, Any]:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
     token = authorization.split(" ", 1)[1]
+    global _TOKEN_USERS_V
+    users_v = USERS.version()[0]
+    with _TOKEN_LOCK:
+        if users_v != _TOKEN_USERS_V:
+            _TOKEN_CACHE.clear(); _TOKENS_BY_USER.clear()
+            _TOKEN_USERS_V = users_v
+        hit = _TOKEN_CACHE.get(token)
+        if hit is not None:
+            if hit[1] > time.time():
+                _TOKEN_CACHE.move_to_end(token)
+                return dict(hit[0])
+            del _TOKEN_CACHE[token]
+            _TOKENS_BY_USER.get(hit[0]["username"], set()).discard(token)
     claims = decode_access_token(token)
     username = claims.get("sub")
-    role = claims.get("role", "user")
     user = USERS.get(username)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return {"username": username, "role": role}
+    # the stored role wins so that role changes apply to tokens issued before them
+    current = {"username": username, "role": user.get("role") or claims.get("role", "user")}
+    _cache_token(token, current, float(claims.get("exp", 0)), users_v)
+    return dict(current)
 
 # -------------------------------------------------
 # Endpoints
@@ -115,7 +1806,7 @@ def health():
 @app.post("/login")
 def login(username: str = Form(...), password: str = Form(...)):
     user = USERS.get(username)
-    if not user or user["password"] != password:
+    if not user or not check_password(user, password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     token = create_access_token(user["username"], user.get("role", "user"))
     return {"access_token": token, "token_type": "bearer", "role": user.get("role", "user")}
@@ -137,7 +1828,10 @@ def refresh_token(authorization: str = Header(default="")):
     return {"access_token": new_token, "token_type": "bearer", "role": role}
 
 @app.get("/kpis")
-def kpis(user=Depends(get_current_user)):
+def kpis(request: Request, response: Response, user=Depends(get_current_user)):
+    hit = not_modified(request, response, extra=f"{len(KNOWLEDGE)}.{len(FUNDING)}")
+    if hit:
+        return hit
     return {
         "experiments_this_week": 0,
         "documents_indexed": len(KNOWLEDGE),
@@ -148,26 +1842,37 @@ def kpis(user=Depends(get_current_user)):
 # ---- Knowledge ----
 @app.post("/knowledge/ingest")
 def knowledge_ingest(file: UploadFile = File(...), user=Depends(get_current_user)):
-    try:
-        text = file.file.read().decode("utf-8", errors="ignore")
-    except Exception:
-        text = ""
-    item = {"id": str(int(time.time() * 1000)), "name": file.filename or "untitled.txt", "text": text}
-    KNOWLEDGE.append(item)
-    return {"ok": True, "id": item["id"], "name": item["name"], "len": len(text)}
+    doc = KNOWLEDGE.ingest(file.filename or "untitled.txt", file.file)
+    if SEMANTIC.components is not None:
+        SEMANTIC.catch_up()
+    if not doc.get("duplicate") or doc.get("created"):
+        publish("knowledge", "insert", doc["id"], {"id": doc["id"], "name": doc["name"], "len": doc["len"], "chunks": doc["chunks"]})
+    return {"ok": True, "id": doc["id"], "name": doc["name"], "len": doc["len"], "chunks": doc["chunks"],
+            "sha256": doc["sha256"], "duplicate": doc.get("duplicate", False), "ref": doc.get("ref")}
 
 @app.get("/knowledge/search")
-def knowledge_search(q: str, user=Depends(get_current_user)):
-    ql = (q or "").lower()
+def knowledge_search(q: str, limit: int = 20, offset: int = 0, mode: str = "keyword", user=Depends(get_current_user)):
+    if mode not in ("keyword", "semantic"):
+        raise HTTPException(status_code=400, detail="Invalid mode")
+    limit = max(1, min(limit, KNOWLEDGE_PAGE_MAX)); offset = max(0, offset)
+    if mode == "semantic" and not SEMANTIC.ready():
+        raise HTTPException(status_code=503, detail="Semantic index is being built; retry shortly",
+                            headers={"Retry-After": "5"})
+    engine = SEMANTIC if mode == "semantic" else KNOWLEDGE
     hits: List[Dict[str, Any]] = []
-    for it in KNOWLEDGE:
-        t = it.get("text", "")
-        i = t.lower().find(ql)
-        if i >= 0:
-            start = max(0, i - 60); end = min(len(t), i + 60)
-            hits.append({"title": it.get("name", "(untitled)"), "snippet": t[start:end]})
+    for score, doc, t, i in engine.search(q, offset + limit)[offset:]:
+        start = max(0, i - 60); end = min(len(t), i + 60)
+        hits.append({"title": doc.get("name", "(untitled)"), "snippet": t[start:end], "score": round(score, 4)})
     return hits
 
+@app.post("/knowledge/semantic/rebuild")
+def knowledge_semantic_rebuild(user=Depends(get_current_user)):
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+    out = SEMANTIC.fit()
+    publish("knowledge", "rebuild")
+    return {"ok": True, **out}
+
 # ---- Procurement demo ----
 @app.post("/ops/vendor/checklist")
 def vendor_checklist(vendor: str = Form(...), country: str = Form("IN"), use_case: str = Form("general"), user=Depends(get_current_user)):
@@ -187,16 +1892,37 @@ def vendor_checklist(vendor: str = Form(...), country: str = Form("IN"), use_cas
 def admin_add_user(username: str = Form(...), password: str = Form(...), role: str = Form("user"), user=Depends(get_current_user)):
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
-    USERS[username] = {"username": username, "password": password, "role": role}
+    USERS.put({"username": username, "password_hash": hash_password(password), "role": role})
+    invalidate_user_tokens(username)
+    publish("users", "update", username, {"username": username, "role": role})
     return {"ok": True, "username": username, "role": role}
 
+@app.post("/admin/users/delete")
+def admin_delete_user(username: str = Form(...), user=Depends(get_current_user)):
+    if user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admins only")
+    if username == user["username"]:
+        raise HTTPException(status_code=400, detail="Cannot delete yourself")
+    if not USERS.delete(username):
+        raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_tokens(username)
+    publish("users", "delete", username)
+    return {"ok": True, "username": username}
+
 
-# ------------- R&D: Experiments & Results (in-memory MVP) -------------
-EXPERIMENTS: Dict[str, Dict[str, Any]] = {}  # id -> {id,title,objective,params,status,ts}
-RESULTS: List[Dict[str, Any]] = []           # [{exp_id,name,bytes/text,ts}]
+# ------------- R&D: Experiments & Results -------------
+EXPERIMENTS = table("experiments", key="id", indexes=("ts", "status"))  # {id,title,objective,params,status,ts}
+RESULTS = table("results", key="id", indexes=("ts", "exp_id"))         # {id,exp_id,name,content_type,sha256,bytes,series,ts}; payload in BLOB_STORE
 
-def _mk_id() -> str:
-    return str(int(time.time() * 1000))
+def _add_result(background: BackgroundTasks, exp_id: str, name: str, content_type: str, sha: str, size: int) -> Dict[str, Any]:
+    # RESULTS row for a stored blob; tabular files get their numeric columns parsed after the response
+    tabular = _looks_tabular(name, content_type)
+    item = RESULTS.insert({"id": new_id(), "exp_id": exp_id, "name": name, "content_type": content_type,
+                           "ts": int(time.time()), "sha256": sha, "bytes": size, "series": "pending" if tabular else "none"})
+    publish("results", "insert", item["id"], item)
+    if tabular:
+        background.add_task(_index_series, item["id"], sha)
+    return item
 
 @app.post("/rnd/experiments/create")
 def rnd_create_experiment(payload: str = Form(...), user=Depends(get_current_user)):
@@ -205,146 +1931,1108 @@ def rnd_create_experiment(payload: str = Form(...), user=Depends(get_current_use
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON in payload")
     title = data.get("title") or "Untitled"
-    exp_id = _mk_id()
-    EXPERIMENTS[exp_id] = {
+    exp_id = new_id()
+    exp = EXPERIMENTS.insert({
         "id": exp_id,
         "title": title,
         "objective": data.get("objective",""),
         "params": data.get("params",{}),
         "status": "planned",
         "ts": int(time.time()),
-    }
-    return {"ok": True, "experiment": EXPERIMENTS[exp_id]}
+    })
+    publish("experiments", "insert", exp_id, exp)
+    return {"ok": True, "experiment": exp}
 
 @app.get("/rnd/experiments")
-def rnd_list_experiments(user=Depends(get_current_user)):
+def rnd_list_experiments(request: Request, response: Response, limit: int = PAGE_DEFAULT, cursor: Optional[str] = None,
+                         user=Depends(get_current_user)):
     # newest first
-    return sorted(EXPERIMENTS.values(), key=lambda x: x["ts"], reverse=True)
+    return not_modified(request, response, EXPERIMENTS) or list_page(EXPERIMENTS, response, limit, cursor)
 
 @app.post("/rnd/experiments/status")
 def rnd_update_status(exp_id: str = Form(...), status: str = Form(...), user=Depends(get_current_user)):
-    if exp_id not in EXPERIMENTS:
-        raise HTTPException(status_code=404, detail="Experiment not found")
     if status not in {"planned","running","paused","completed","failed"}:
         raise HTTPException(status_code=400, detail="Invalid status")
-    EXPERIMENTS[exp_id]["status"] = status
-    return {"ok": True, "experiment": EXPERIMENTS[exp_id]}
+    exp = EXPERIMENTS.update(exp_id, {"status": status})
+    if exp is None:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    publish("experiments", "update", exp_id, exp)
+    return {"ok": True, "experiment": exp}
 
 @app.post("/rnd/results/upload")
-def rnd_results_upload(exp_id: str = Form(...), file: UploadFile = File(...), user=Depends(get_current_user)):
+def rnd_results_upload(background: BackgroundTasks, exp_id: str = Form(...), file: UploadFile = File(...),
+                       user=Depends(get_current_user)):
+    if exp_id not in EXPERIMENTS:
+        raise HTTPException(status_code=404, detail="Experiment not found")
+    sha, size, duplicate = BLOB_STORE.put(file.file)
+    item = _add_result(background, exp_id, file.filename or "result.bin", file.content_type or "application/octet-stream", sha, size)
+    return {"ok": True, "result": item, "duplicate": duplicate}
+
+@app.get("/rnd/results")
+def rnd_results(request: Request, response: Response, exp_id: Optional[str] = None, limit: int = PAGE_DEFAULT, cursor: Optional[str] = None,
+                user=Depends(get_current_user)):
+    eq = {"exp_id": exp_id} if exp_id else {}
+    return not_modified(request, response, RESULTS) or list_page(RESULTS, response, limit, cursor, **eq)
+
+@app.get("/rnd/results/{result_id}/download")
+def rnd_result_download(result_id: str, user=Depends(get_current_user)):
+    # full file, or the requested part of it for a Range header (206)
+    r = RESULTS.get(result_id)
+    if r is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    path = BLOB_STORE.path(r["sha256"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="Result payload is no longer stored")
+    return FileResponse(path, media_type=r.get("content_type") or "application/octet-stream", filename=r["name"])
+
+# Resumable uploads for multi-GB instrument files:
+#   POST /rnd/uploads                        initiate with the total size (and ideally the sha256)
+#   PUT  /rnd/uploads/{id}/chunks/{n}        raw bytes at ?offset= (default n * chunk_size); any order, in parallel
+#   GET  /rnd/uploads/{id}                   received / missing byte ranges, half-open [start, end)
+#   POST /rnd/uploads/{id}/finalize          checks completeness and the hash, then files the result
+# Chunks go straight into a preallocated temp file next to the blob store. Every received range is
+# its own UPLOAD_PARTS row, so parallel PUTs never read-modify-write shared upload state.
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_TTL_SECONDS = int(os.getenv("UPLOAD_TTL_SECONDS", str(24 * 3600)))
+UPLOADS = table("uploads", key="id", indexes=("ts",))                     # {id,exp_id,name,content_type,size,sha256,chunk_size,user,ts}
+UPLOAD_PARTS = table("upload_parts", key="id", indexes=("ts", "upload_id"))  # {id,upload_id,offset,length,ts}
+
+def _upload_path(upload_id: str) -> str:
+    return os.path.join(BLOB_STORE.tmp, f"upload-{upload_id}")
+
+def _received(upload_id: str) -> List[List[int]]:
+    spans = sorted((p["offset"], p["offset"] + p["length"]) for p in UPLOAD_PARTS.find(upload_id=upload_id))
+    out: List[List[int]] = []
+    for a, b in spans:
+        if out and a <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+def _missing(received: List[List[int]], size: int) -> List[List[int]]:
+    out, pos = [], 0
+    for a, b in received:
+        if a > pos:
+            out.append([pos, a])
+        pos = max(pos, b)
+    if pos < size:
+        out.append([pos, size])
+    return out
+
+def _get_upload(upload_id: str, user: Dict[str, Any]) -> Dict[str, Any]:
+    up = UPLOADS.get(upload_id)
+    if up is None or (up["user"] != user["username"] and user.get("role") != "admin"):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return up
+
+def _drop_upload(upload_id: str) -> None:
+    for p in UPLOAD_PARTS.find(upload_id=upload_id):
+        UPLOAD_PARTS.delete(p["id"])
+    if UPLOADS.delete(upload_id):
+        publish("uploads", "delete", upload_id)
+    try:
+        os.unlink(_upload_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+@app.post("/rnd/uploads")
+def rnd_upload_initiate(exp_id: str = Form(...), name: str = Form(...), size: int = Form(...),
+                        sha256: Optional[str] = Form(None), content_type: str = Form("application/octet-stream"),
+                        user=Depends(get_current_user)):
     if exp_id not in EXPERIMENTS:
         raise HTTPException(status_code=404, detail="Experiment not found")
-    content = file.file.read()
-    item = {"exp_id": exp_id, "name": file.filename or "result.bin", "ts": int(time.time())}
+    if size < 0:
+        raise HTTPException(status_code=400, detail="size must be >= 0")
+    for stale in UPLOADS.find(ts_max=int(time.time()) - UPLOAD_TTL_SECONDS):
+        _drop_upload(stale["id"])
+    up = {"id": new_id(), "exp_id": exp_id, "name": name, "content_type": content_type, "size": int(size),
+          "sha256": (sha256 or "").lower() or None, "chunk_size": UPLOAD_CHUNK_BYTES, "user": user["username"],
+          "ts": int(time.time())}
+    with open(_upload_path(up["id"]), "wb") as f:
+        f.truncate(size)  # sparse; chunks fill it in place
+    UPLOADS.insert(up)
+    publish("uploads", "insert", up["id"], up)
+    return {"ok": True, "upload": up}
+
+@app.put("/rnd/uploads/{upload_id}/chunks/{n}")
+async def rnd_upload_chunk(upload_id: str, n: int, request: Request, offset: Optional[int] = None,
+                           user=Depends(get_current_user)):
+    up = await run_in_threadpool(_get_upload, upload_id, user)
+    start = n * up["chunk_size"] if offset is None else offset
+    if start < 0 or start > up["size"]:
+        raise HTTPException(status_code=416, detail="Offset outside the upload")
+    try:
+        fd = os.open(_upload_path(upload_id), os.O_WRONLY)
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="Upload expired")
+    pos, buf = start, bytearray()
+    try:
+        async for block in request.stream():
+            buf += block
+            if pos + len(buf) > up["size"]:
+                raise HTTPException(status_code=413, detail="Chunk runs past the declared size")
+            if len(buf) >= BLOB_BLOCK_BYTES:
+                pos += await run_in_threadpool(os.pwrite, fd, bytes(buf), pos)
+                buf.clear()
+        if buf:
+            pos += await run_in_threadpool(os.pwrite, fd, bytes(buf), pos)
+        await run_in_threadpool(os.fsync, fd)
+    finally:
+        os.close(fd)
+    # only a chunk that arrived completely counts as received; a dropped one is simply resent
+    if pos > start:
+        await run_in_threadpool(UPLOAD_PARTS.put, {"id": f"{upload_id}:{start}", "upload_id": upload_id,
+                                                   "offset": start, "length": pos - start, "ts": int(time.time())})
+    return {"ok": True, "offset": start, "length": pos - start}
+
+@app.get("/rnd/uploads/{upload_id}")
+def rnd_upload_status(upload_id: str, user=Depends(get_current_user)):
+    up = _get_upload(upload_id, user)
+    received = _received(upload_id)
+    missing = _missing(received, up["size"])
+    return {**up, "received": received, "missing": missing,
+            "received_bytes": sum(b - a for a, b in received), "complete": not missing}
+
+@app.post("/rnd/uploads/{upload_id}/finalize")
+def rnd_upload_finalize(upload_id: str, background: BackgroundTasks, user=Depends(get_current_user)):
+    up = _get_upload(upload_id, user)
+    missing = _missing(_received(upload_id), up["size"])
+    if missing:
+        raise HTTPException(status_code=409, detail=f"Upload incomplete; missing byte ranges {missing[:10]}")
+    path = _upload_path(upload_id)
     try:
-        # Try store as text if decodable (handy for CSV/TXT)
-        item["text"] = content.decode("utf-8", errors="ignore")[:200000]
+        with open(path, "rb") as f:
+            sha, size = _stream_digest(f)
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail="Upload expired")
+    if up.get("sha256") and sha != up["sha256"]:
+        _drop_upload(upload_id)
+        raise HTTPException(status_code=422, detail=f"sha256 mismatch: expected {up['sha256']}, got {sha}; upload discarded")
+    duplicate = BLOB_STORE.adopt(path, sha)
+    item = _add_result(background, up["exp_id"], up["name"], up["content_type"], sha, size)
+    _drop_upload(upload_id)
+    return {"ok": True, "result": item, "duplicate": duplicate}
+
+# Numeric series: the numeric columns of a CSV/TSV result, parsed once per blob into
+# BLOB_STORE.root/series/<sha256>/{meta.json, <i>.npy}. Columns are float64 (NaN for cells that
+# did not parse) and are memory-mapped on read, so charts fetch a downsampled view and
+# cross-experiment aggregates combine the per-column sums in meta.json without loading arrays.
+SERIES_CHUNK_ROWS = int(os.getenv("SERIES_CHUNK_ROWS", "200000"))
+SERIES_POINTS_MAX = int(os.getenv("SERIES_POINTS_MAX", "10000"))
+_TABULAR_EXT = (".csv", ".tsv", ".txt", ".dat")
+
+def _looks_tabular(name: str, content_type: str) -> bool:
+    return name.lower().endswith(_TABULAR_EXT) or content_type in ("text/csv", "text/tab-separated-values", "text/plain")
+
+def _series_dir(sha: str) -> str:
+    return os.path.join(BLOB_STORE.root, "series", sha)
+
+_NPY_HEADER = 128  # bytes reserved for the .npy header, enough for any 1-d float64 shape
+
+def _npy_header(rows: int) -> bytes:
+    # version 1.0 header of a 1-d little-endian float64 array, padded to _NPY_HEADER bytes
+    d = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d,), }" % rows
+    body = (d.ljust(_NPY_HEADER - 11) + "\n").encode("latin1")
+    return b"\x93NUMPY\x01\x00" + len(body).to_bytes(2, "little") + body
+
+class _ColumnStats:
+    # count/min/max/sum/sumsq plus mean and M2 combined chunk by chunk (Chan et al.)
+    def __init__(self):
+        self.n, self.mean, self.m2, self.sum, self.sumsq = 0, 0.0, 0.0, 0.0, 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, ok: np.ndarray) -> None:
+        if not len(ok):
+            return
+        n, mean = len(ok), float(ok.mean())
+        m2 = float(np.square(ok - mean).sum())
+        total = self.n + n
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.mean += delta * n / total
+        self.n = total
+        self.sum += float(ok.sum()); self.sumsq += float(np.square(ok).sum())
+        lo, hi = float(ok.min()), float(ok.max())
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+
+    def meta(self, name: str) -> Dict[str, Any]:
+        has = self.n > 0
+        return {"name": name, "count": self.n, "min": self.min, "max": self.max,
+                "mean": self.mean if has else None, "std": math.sqrt(self.m2 / self.n) if has else None,
+                "sum": self.sum, "sumsq": self.sumsq}
+
+def _parse_series(sha: str) -> str:
+    # -> "ready" | "none" (no numeric columns / not text); writes the series dir atomically.
+    # Each chunk is appended to its column's .npy file as it is parsed, so at most one chunk
+    # is held in memory.
+    path = BLOB_STORE.path(sha)
+    with open(path, "rb") as f:
+        head = f.read(64 * 1024)
+    if b"\0" in head:
+        return "none"
+    lines = (ln.strip() for ln in head.decode("utf-8", errors="ignore").splitlines())
+    first = next((ln for ln in lines if ln and not ln.startswith("#")), "")
+    sep = max(("\t", ",", ";"), key=first.count) if any(c in first for c in "\t,;") else r"\s+"
+    fields = [x for x in re.split(sep, first.strip()) if x]
+    header = None if fields and all(re.fullmatch(r"[-+.\deE]+", x) for x in fields) else "infer"
+    keep: Optional[List[Any]] = None
+    tmp, files, stats = "", [], []
+    rows = 0
+    try:
+        for chunk in pd.read_csv(path, sep=sep, header=header, comment="#", chunksize=SERIES_CHUNK_ROWS,
+                                 dtype=str, encoding_errors="ignore", engine="python" if sep == r"\s+" else "c"):
+            nums = {c: pd.to_numeric(chunk[c], errors="coerce").to_numpy(dtype=np.float64) for c in chunk.columns}
+            if keep is None:
+                # numeric columns = mostly-parseable in the first chunk
+                keep = [c for c, a in nums.items() if len(a) and np.isfinite(a).mean() >= 0.9]
+                if not keep:
+                    return "none"
+                tmp = tempfile.mkdtemp(dir=BLOB_STORE.tmp)
+                for i in range(len(keep)):
+                    files.append(open(os.path.join(tmp, f"{i}.npy"), "wb"))
+                    files[-1].write(b"\0" * _NPY_HEADER)  # filled in once the row count is known
+                    stats.append(_ColumnStats())
+            for c, fh, st in zip(keep, files, stats):
+                a = nums.get(c)
+                if a is None:
+                    a = np.full(len(chunk), np.nan)
+                fh.write(a.astype("<f8", copy=False).tobytes())
+                st.add(a[np.isfinite(a)])
+            rows += len(chunk)
+        if not keep:
+            return "none"
+        for fh in files:
+            fh.seek(0); fh.write(_npy_header(rows)); fh.close()
+        cols = [st.meta(f"col{c}" if header is None else str(c)) for c, st in zip(keep, stats)]
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"rows": rows, "columns": cols}, f)
+        final = _series_dir(sha)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        try:
+            os.replace(tmp, final)
+            tmp = ""
+        except OSError:  # parsed concurrently by another worker
+            pass
+        return "ready"
+    finally:
+        for fh in files:
+            fh.close()
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+def _index_series(result_id: str, sha: str) -> None:
+    try:
+        state = "ready" if os.path.exists(os.path.join(_series_dir(sha), "meta.json")) else _parse_series(sha)
     except Exception:
-        item["bytes"] = len(content)
-    RESULTS.append(item)
-    return {"ok": True, "result": item}
+        state = "error"
+    row = RESULTS.update(result_id, {"series": state})
+    if row is not None:
+        publish("results", "update", result_id, row)
 
-@app.get("/rnd/results")
-def rnd_results(exp_id: Optional[str] = None, user=Depends(get_current_user)):
-    rows = [r for r in RESULTS if (not exp_id or r["exp_id"] == exp_id)]
-    rows.sort(key=lambda x: x["ts"], reverse=True)
-    return rows
+def _series_meta(r: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(_series_dir(r["sha256"]), "meta.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
+def _series_col(sha: str, meta: Dict[str, Any], name: str) -> np.ndarray:
+    names = [c["name"] for c in meta["columns"]]
+    if name not in names:
+        lowered = [n.lower() for n in names]
+        if name.lower() not in lowered:
+            raise HTTPException(status_code=404, detail=f"No numeric column {name!r}; have {names}")
+        name = names[lowered.index(name.lower())]
+    return np.load(os.path.join(_series_dir(sha), f"{names.index(name)}.npy"), mmap_mode="r")
 
-# ------------- Procurement (in-memory MVP) -------------
-VENDORS: Dict[str, Dict[str, Any]] = VENDORS if 'VENDORS' in globals() else {}
-RFQS: List[Dict[str, Any]] = RFQS if 'RFQS' in globals() else []
+def _lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: indices of n points that keep the visual shape of (x, y)
+    L = len(x)
+    if n >= L or n < 3:
+        return np.arange(L)
+    edges = np.linspace(1, L - 1, n - 1).astype(np.int64)  # n-2 buckets between the fixed end points
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, L - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (L - 1, L)
+        ax, ay = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - ax) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ay - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
 
-def _now_id() -> str:
-    return str(int(time.time() * 1000))
+def _minmax(y: np.ndarray, n: int) -> np.ndarray:
+    # min and max of each of n/2 buckets, in index order; keeps spikes that LTTB may average out
+    L = len(y)
+    if n >= L:
+        return np.arange(L)
+    edges = np.linspace(0, L, max(1, n // 2) + 1).astype(np.int64)
+    idx = [(lo + int(np.argmin(y[lo:hi])), lo + int(np.argmax(y[lo:hi]))) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+    return np.unique(np.array(idx, dtype=np.int64).ravel())
+
+def _result_series(result_id: str) -> tuple:
+    r = RESULTS.get(result_id)
+    if r is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return r, _series_meta(r)
+
+@app.get("/rnd/results/{result_id}/series")
+def rnd_result_series(result_id: str, user=Depends(get_current_user)):
+    # parse state, row count and per-column statistics
+    r, meta = _result_series(result_id)
+    return {"result_id": result_id, "status": r.get("series", "none"), **(meta or {"rows": 0, "columns": []})}
+
+@app.get("/rnd/results/{result_id}/series/data")
+def rnd_result_series_data(result_id: str, y: str, x: Optional[str] = None, points: int = 2000, method: str = "lttb",
+                           x_min: Optional[float] = None, x_max: Optional[float] = None, user=Depends(get_current_user)):
+    # up to `points` points per y column (comma-separated); x defaults to the row number
+    if method not in ("lttb", "minmax"):
+        raise HTTPException(status_code=400, detail="method must be 'lttb' or 'minmax'")
+    r, meta = _result_series(result_id)
+    if meta is None:
+        raise HTTPException(status_code=409, detail=f"No parsed series for this result (status: {r.get('series', 'none')})")
+    points = max(3, min(points, SERIES_POINTS_MAX))
+    xs = np.asarray(_series_col(r["sha256"], meta, x), dtype=np.float64) if x else np.arange(meta["rows"], dtype=np.float64)
+    out = []
+    for name in [c.strip() for c in y.split(",") if c.strip()]:
+        ys = np.asarray(_series_col(r["sha256"], meta, name))
+        keep = np.isfinite(ys) & np.isfinite(xs)
+        if x_min is not None:
+            keep &= xs >= x_min
+        if x_max is not None:
+            keep &= xs <= x_max
+        sel = np.flatnonzero(keep)
+        px, py = xs[sel], ys[sel]
+        idx = _lttb(px, py, points) if method == "lttb" else _minmax(py, points)
+        out.append({"y": name, "points": len(sel), "x": px[idx].tolist(), "values": py[idx].tolist()})
+    return {"result_id": result_id, "x": x or "row", "method": method, "series": out}
+
+@app.get("/rnd/series/aggregate")
+def rnd_series_aggregate(request: Request, response: Response, column: str, exp_ids: Optional[str] = None,
+                         user=Depends(get_current_user)):
+    # per-experiment count/mean/std/min/max of one numeric column over all parsed results
+    hit = not_modified(request, response, RESULTS, EXPERIMENTS)
+    if hit:
+        return hit
+    wanted = [e for e in (exp_ids or "").split(",") if e]
+    results = [r for e in wanted for r in RESULTS.find(exp_id=e)] if wanted else RESULTS.all()
+    groups: Dict[str, Dict[str, Any]] = {}
+    for r in results:
+        meta = _series_meta(r) if r.get("series") == "ready" else None
+        col = next((c for c in (meta or {}).get("columns", []) if c["name"].lower() == column.lower()), None)
+        if col is None or not col["count"]:
+            continue
+        g = groups.setdefault(r["exp_id"], {"exp_id": r["exp_id"], "results": 0, "count": 0, "sum": 0.0, "sumsq": 0.0,
+                                            "min": col["min"], "max": col["max"]})
+        g["results"] += 1; g["count"] += col["count"]; g["sum"] += col["sum"]; g["sumsq"] += col["sumsq"]
+        g["min"], g["max"] = min(g["min"], col["min"]), max(g["max"], col["max"])
+    out = []
+    for g in groups.values():
+        mean = g.pop("sum") / g["count"]
+        g["mean"], g["std"] = mean, math.sqrt(max(0.0, g.pop("sumsq") / g["count"] - mean * mean))
+        g["title"] = (EXPERIMENTS.get(g["exp_id"]) or {}).get("title")
+        out.append(g)
+    return {"column": column, "experiments": out}
+
+
+# ------------- Procurement -------------
+VENDORS = table("vendors", key="id", indexes=("ts",))
+RFQS = table("rfqs", key="id", indexes=("ts", "vendor_id", "status"))
 
 @app.post("/ops/vendors/create")
 def vendors_create(name: str = Form(...), country: str = Form("IN"), rating: int = Form(3), user=Depends(get_current_user)):
-    vid = _now_id()
-    VENDORS[vid] = {"id": vid, "name": name.strip(), "country": country.strip(), "rating": int(rating), "ts": int(time.time())}
-    return {"ok": True, "vendor": VENDORS[vid]}
+    vid = new_id()
+    vendor = VENDORS.insert({"id": vid, "name": name.strip(), "country": country.strip(), "rating": int(rating), "ts": int(time.time())})
+    publish("vendors", "insert", vid, vendor)
+    return {"ok": True, "vendor": vendor}
 
 @app.get("/ops/vendors")
-def vendors_list(user=Depends(get_current_user)):
-    return sorted(VENDORS.values(), key=lambda x: x["ts"], reverse=True)
+def vendors_list(request: Request, response: Response, limit: int = PAGE_DEFAULT, cursor: Optional[str] = None,
+                 user=Depends(get_current_user)):
+    return not_modified(request, response, VENDORS) or list_page(VENDORS, response, limit, cursor)
 
 @app.post("/ops/rfq/create")
 def rfq_create(vendor_id: str = Form(...), item: str = Form(...), qty: int = Form(...), currency: str = Form("INR"), user=Depends(get_current_user)):
-    if vendor_id not in VENDORS:
+    vendor = VENDORS.get(vendor_id)
+    if vendor is None:
         raise HTTPException(status_code=404, detail="Vendor not found")
-    rid = _now_id()
+    rid = new_id()
     row = {
-        "id": rid, "vendor_id": vendor_id, "vendor": VENDORS[vendor_id]["name"],
+        "id": rid, "vendor_id": vendor_id, "vendor": vendor["name"],
         "item": item.strip(), "qty": int(qty), "currency": currency.strip(),
         "status": "draft", "ts": int(time.time())
     }
-    RFQS.append(row)
+    RFQS.insert(row)
+    publish("rfqs", "insert", rid, row)
     return {"ok": True, "rfq": row}
 
 @app.get("/ops/rfq")
-def rfq_list(user=Depends(get_current_user)):
-    return sorted(RFQS, key=lambda x: x["ts"], reverse=True)
+def rfq_list(request: Request, response: Response, vendor_id: Optional[str] = None, status: Optional[str] = None,
+             since: Optional[int] = None, until: Optional[int] = None,
+             limit: int = PAGE_DEFAULT, cursor: Optional[str] = None, user=Depends(get_current_user)):
+    # optional filters: vendor, status, created-at range (epoch seconds, inclusive)
+    eq = {k: v for k, v in (("vendor_id", vendor_id), ("status", status)) if v}
+    return not_modified(request, response, RFQS) or list_page(RFQS, response, limit, cursor, ts_min=since, ts_max=until, **eq)
+
+@app.get("/ops/rfq/{rfq_id}")
+def rfq_get(rfq_id: str, user=Depends(get_current_user)):
+    r = RFQS.get(rfq_id)
+    if r is None:
+        raise HTTPException(status_code=404, detail="RFQ not found")
+    return r
 
 @app.post("/ops/rfq/quote")
 def rfq_quote(rfq_id: str = Form(...), price: float = Form(...), lead_time_days: int = Form(...), user=Depends(get_current_user)):
-    for r in RFQS:
-        if r["id"] == rfq_id:
-            r["price"] = float(price)
-            r["lead_time_days"] = int(lead_time_days)
-            r["status"] = "quoted"
-            return {"ok": True, "rfq": r}
-    raise HTTPException(status_code=404, detail="RFQ not found")
+    r = RFQS.update(rfq_id, {"price": float(price), "lead_time_days": int(lead_time_days), "status": "quoted"})
+    if r is None:
+        raise HTTPException(status_code=404, detail="RFQ not found")
+    publish("rfqs", "update", rfq_id, r)
+    return {"ok": True, "rfq": r}
 
 @app.post("/ops/rfq/choose")
 def rfq_choose(rfq_id: str = Form(...), approve: bool = Form(...), user=Depends(get_current_user)):
-    for r in RFQS:
-        if r["id"] == rfq_id:
-            r["status"] = "approved" if approve else "rejected"
-            r["decision_ts"] = int(time.time())
-            return {"ok": True, "rfq": r}
-    raise HTTPException(status_code=404, detail="RFQ not found")
+    r = RFQS.update(rfq_id, {"status": "approved" if approve else "rejected", "decision_ts": int(time.time())})
+    if r is None:
+        raise HTTPException(status_code=404, detail="RFQ not found")
+    publish("rfqs", "update", rfq_id, r)
+    return {"ok": True, "rfq": r}
+
+
+# ---------------- Accounting ----------------
+# LEDGER rows: {id, date, description, amount, type, category, ts}. SQLite keeps them as rows;
+# in memory mode the typed columns of LedgerColumns (below) are the only copy.
+LEDGER = table("ledger", key="id", indexes=("ts",)) if _DB_POOL is not None else None
+
+NO_DAY = np.iinfo(np.int64).min
+
+def _parse_days(dates: List[str]) -> np.ndarray:
+    # date strings -> int64 days (NO_DAY if unparseable); parsed once per distinct string
+    inv, uniq = pd.factorize(pd.Series(dates, dtype=object).astype(str))
+    parsed = pd.to_datetime(pd.Series(uniq, dtype=object), errors="coerce", format="mixed")
+    days = parsed.to_numpy(dtype="datetime64[D]").astype(np.int64)
+    days[parsed.isna().to_numpy()] = NO_DAY
+    return days[inv]
+
+def _months(dates: pd.Series) -> pd.Series:
+    # "YYYY-MM" per date string, "unknown" when it does not parse; same parse as the column
+    # store (_parse_days), so /accounting/summary and /accounting/groupby agree
+    inv, uniq = pd.factorize(_parse_days(dates.tolist()))
+    months = uniq.astype("datetime64[D]").astype("datetime64[M]").astype(str)
+    return pd.Series(np.where(uniq == NO_DAY, "unknown", months)[inv], index=dates.index)
+
+class LedgerTotals:
+    # Running income / expense / row count per bucket: "all", "month:YYYY-MM", "category:<name>".
+    # Updated together with the ledger insert (same lock in memory, same transaction in SQLite),
+    # so KPIs and summaries never rescan the ledger.
+    SCHEMA = "schema:2"  # marker row; bump when bucketing changes so stored totals get rebuilt
+
+    def __init__(self, pool: Optional[_SqlitePool]):
+        self.pool = pool
+        self.mem: Dict[str, List[float]] = {}
+        if pool is not None:
+            with pool.conn() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS ledger_totals (bucket TEXT PRIMARY KEY, "
+                             "income REAL NOT NULL, expense REAL NOT NULL, n INTEGER NOT NULL)")
+
+    @staticmethod
+    def _delta(rows) -> Dict[str, List[float]]:
+        # rows: list of ledger dicts or a DataFrame with the same columns
+        df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+        if df.empty:
+            return {}
+        amount = df["amount"].astype(float)
+        frame = pd.DataFrame({"income": amount.where(df["type"] == "income", 0.0),
+                              "expense": amount.where(df["type"] == "expense", 0.0), "n": 1})
+        category = df["category"].replace("", None) if "category" in df else pd.Series(None, index=df.index, dtype=object)
+        d = {"all": [frame["income"].sum(), frame["expense"].sum(), len(frame)]}
+        for keys in ("month:" + _months(df["date"]), "category:" + category.fillna("uncategorized")):
+            for b, t in frame.groupby(keys.to_numpy()).sum().iterrows():
+                d[b] = [float(t["income"]), float(t["expense"]), int(t["n"])]
+        return d
+
+    def add(self, rows, conn: Optional[sqlite3.Connection] = None) -> None:
+        d = self._delta(rows)
+        if conn is None:
+            for b, (inc, exp, n) in d.items():
+                t = self.mem.setdefault(b, [0.0, 0.0, 0])
+                t[0] += inc; t[1] += exp; t[2] += n
+            return
+        conn.executemany("INSERT INTO ledger_totals (bucket, income, expense, n) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT(bucket) DO UPDATE SET income = income + excluded.income, "
+                         "expense = expense + excluded.expense, n = n + excluded.n",
+                         [(b, float(inc), float(exp), int(n)) for b, (inc, exp, n) in d.items()])
+
+    def backfill(self) -> None:
+        # ledgers written before the totals table existed, or bucketed by an older rule
+        if self.pool is None:
+            return
+        with self.pool.tx() as conn:
+            if conn.execute("SELECT 1 FROM ledger_totals WHERE bucket = ?", (self.SCHEMA,)).fetchone() is None:
+                conn.execute("DELETE FROM ledger_totals")
+                rows = [json.loads(d) for (d,) in conn.execute("SELECT data FROM ledger")]
+                if rows:
+                    self.add(rows, conn)
+                conn.execute("INSERT INTO ledger_totals (bucket, income, expense, n) VALUES (?, 0, 0, 0)", (self.SCHEMA,))
+
+    def get(self, bucket: str) -> tuple:
+        # -> (income, expense, rows)
+        if self.pool is None:
+            return tuple(self.mem.get(bucket, (0.0, 0.0, 0)))
+        with self.pool.conn() as conn:
+            hit = conn.execute("SELECT income, expense, n FROM ledger_totals WHERE bucket = ?", (bucket,)).fetchone()
+        return tuple(hit) if hit else (0.0, 0.0, 0)
+
+    def buckets(self, prefix: str) -> Dict[str, tuple]:
+        # bucket name (prefix stripped) -> (income, expense, rows)
+        if self.pool is None:
+            return {b[len(prefix):]: tuple(t) for b, t in self.mem.items() if b.startswith(prefix)}
+        with self.pool.conn() as conn:
+            hits = conn.execute("SELECT bucket, income, expense, n FROM ledger_totals WHERE bucket >= ? AND bucket < ?",
+                                (prefix, prefix + "\uffff")).fetchall()
+        return {b[len(prefix):]: (inc, exp, n) for b, inc, exp, n in hits}
+
+LEDGER_TOTALS = LedgerTotals(_DB_POOL)
+LEDGER_TOTALS.backfill()
+
+# Columnar ledger for date-range reports: one typed array per field (~28 bytes/row)
+#   day       int64 days since 1970-01-01 (NO_DAY when the date did not parse)
+#   amount    float64
+#   type, category, description   int32 codes into per-column dictionaries
+# plus `order`, row positions sorted by day, so a date range is two searchsorted calls.
+# With SQLite the row table stays the source of truth and the columns catch up by seq before
+# each query, which also picks up rows written by other workers. In memory mode the columns
+# are the store (tbl=None): id, raw date string and ts get columns too (~48 bytes/row in all,
+# against several hundred for a row dict) and LEDGER is this object, serving the row-table
+# calls the ledger needs (insert_many, page, after, version) with the row position as seq.
+# Ledger rows are never updated/deleted. Dates go through _parse_days, as the month totals do.
+LEDGER_SYNC_BATCH = 50000
+
+class _Column:
+    # append-only numpy array with amortized doubling
+    def __init__(self, dtype):
+        self.buf = np.empty(1024, dtype=dtype)
+        self.n = 0
+
+    def extend(self, a: np.ndarray) -> None:
+        need = self.n + len(a)
+        if need > len(self.buf):
+            grown = np.empty(max(need, 2 * len(self.buf)), dtype=self.buf.dtype)
+            grown[:self.n] = self.buf[:self.n]
+            self.buf = grown
+        self.buf[self.n:need] = a
+        self.n = need
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.buf[:self.n]
+
+class _DictColumn(_Column):
+    # dictionary-encoded strings: int32 codes + the distinct values
+    def __init__(self):
+        super().__init__(np.int32)
+        self.words: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def extend_str(self, vals: List[str]) -> None:
+        local, uniq = pd.factorize(pd.Series(vals, dtype=object))
+        glob = np.empty(len(uniq), dtype=np.int32)
+        for i, w in enumerate(uniq):
+            c = self.codes.get(w)
+            if c is None:
+                c = self.codes[w] = len(self.words); self.words.append(w)
+            glob[i] = c
+        self.extend(glob[local])
+
+    def code(self, w: str) -> int:
+        return self.codes.get(w, -1)
+
+def _day_str(d: int) -> str:
+    return "unknown" if d == NO_DAY else str(np.datetime64(int(d), "D"))
+
+class LedgerColumns:
+    def __init__(self, tbl):
+        self.tbl = tbl
+        self.seq = -1
+        self.day, self.amount = _Column(np.int64), _Column(np.float64)
+        self.type, self.category, self.description = _DictColumn(), _DictColumn(), _DictColumn()
+        if tbl is None:
+            self.id, self.ts, self.date = _Column(np.int64), _Column(np.int64), _DictColumn()
+            self.epoch = f"{time.time_ns():x}"
+            self.changes, self.modified = 0, time.time()
+        self.order: Optional[np.ndarray] = None  # None = rebuild before the next range query
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.day.n
+
+    def _append(self, rows: List[Dict[str, Any]]) -> None:
+        days = _parse_days([r.get("date", "") for r in rows])
+        if self.order is not None and (len(self) == 0 or days.min() >= self.day.values[self.order[-1]]):
+            # chronological append (the usual bank export) keeps the index valid
+            self.order = np.concatenate([self.order, len(self) + np.argsort(days, kind="stable")])
+        else:
+            self.order = None
+        if self.tbl is None:
+            self.id.extend(np.fromiter((int(r["id"]) for r in rows), dtype=np.int64, count=len(rows)))
+            self.ts.extend(np.fromiter((r["ts"] for r in rows), dtype=np.int64, count=len(rows)))
+            self.date.extend_str([r.get("date", "") for r in rows])
+        self.day.extend(days)
+        self.amount.extend(np.fromiter((r["amount"] for r in rows), dtype=np.float64, count=len(rows)))
+        self.type.extend_str([r.get("type", "") for r in rows])
+        self.category.extend_str([r.get("category") or "uncategorized" for r in rows])
+        self.description.extend_str([r.get("description", "") for r in rows])
+
+    def _sync(self) -> None:
+        while self.tbl is not None:
+            batch = self.tbl.after(self.seq, LEDGER_SYNC_BATCH)
+            if not batch:
+                return
+            self._append([r for _, r in batch])
+            self.seq = batch[-1][0]
+
+    # --- row-table API, memory mode only (ids come from new_id, so no duplicate check) ---
+    def insert_many(self, rows: List[Dict[str, Any]], then: Optional[Callable] = None) -> int:
+        with self.lock:
+            if rows:
+                self._append(rows)
+            if then:
+                then(None)
+            self.changes += 1; self.modified = time.time()
+        return len(rows)
+
+    def version(self) -> tuple:
+        return f"{self.epoch}.{self.changes}", self.modified
+
+    def _records(self, idx) -> List[Dict[str, Any]]:
+        # the stored rows, as inserted
+        ids, ts, amount = self.id.values[idx], self.ts.values[idx], self.amount.values[idx]
+        dt, d, t, c = (col.values[idx] for col in (self.date, self.description, self.type, self.category))
+        return [{"id": f"{ids[i]:019d}", "date": self.date.words[dt[i]], "description": self.description.words[d[i]],
+                 "amount": float(amount[i]), "type": self.type.words[t[i]], "category": self.category.words[c[i]],
+                 "ts": int(ts[i])} for i in range(len(idx))]
+
+    def page(self, limit: int, before: Optional[int] = None, **filters) -> tuple:
+        # newest first, starting below position `before` -> (rows, position to continue from or None)
+        if any(v is not None for v in filters.values()):
+            raise ValueError("ledger pages take no filters")
+        with self.lock:  # columns grow one after another; read between appends
+            hi = len(self) if before is None else max(0, min(before, len(self)))
+            lo = max(0, hi - limit)
+            return self._records(np.arange(hi - 1, lo - 1, -1)), (lo if lo > 0 else None)
+
+    def after(self, seq: int, limit: int, **eq) -> List[tuple]:
+        if eq:
+            raise ValueError("ledger takes no filters")
+        with self.lock:
+            lo = max(0, seq + 1)
+            hi = min(len(self), lo + limit)
+            return list(zip(range(lo, hi), self._records(np.arange(lo, hi))))
+
+    def select(self, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        # row positions with start <= day <= end (inclusive, None = open), in date order
+        with self.lock:
+            self._sync()
+            if self.order is None:
+                self.order = np.argsort(self.day.values, kind="stable")
+            days = self.day.values[self.order]
+            lo = 0 if start is None else np.searchsorted(days, start, side="left")
+            hi = len(days) if end is None else np.searchsorted(days, end, side="right")
+            if start is None and end is not None:
+                lo = np.searchsorted(days, NO_DAY, side="right")  # an upper bound excludes undated rows
+            return self.order[lo:hi]
+
+    def rows(self, idx: np.ndarray) -> List[Dict[str, Any]]:
+        day, amount = self.day.values[idx], self.amount.values[idx]
+        t, c, d = self.type.values[idx], self.category.values[idx], self.description.values[idx]
+        return [{"date": _day_str(day[i]), "description": self.description.words[d[i]], "amount": float(amount[i]),
+                 "type": self.type.words[t[i]], "category": self.category.words[c[i]]} for i in range(len(idx))]
+
+    def totals(self, idx: np.ndarray, keys: Optional[np.ndarray] = None) -> tuple:
+        # -> (distinct keys, income, expense, rows) per key; one group when keys is None
+        amount, t = self.amount.values[idx], self.type.values[idx]
+        inc = np.where(t == self.type.code("income"), amount, 0.0)
+        exp = np.where(t == self.type.code("expense"), amount, 0.0)
+        if keys is None:
+            return np.zeros(1, dtype=np.int64), np.array([inc.sum()]), np.array([exp.sum()]), np.array([len(idx)])
+        uniq, inv = np.unique(keys, return_inverse=True)
+        return (uniq, np.bincount(inv, inc, len(uniq)), np.bincount(inv, exp, len(uniq)),
+                np.bincount(inv, minlength=len(uniq)))
+
+    def group(self, idx: np.ndarray, by: str) -> List[Dict[str, Any]]:
+        day = self.day.values[idx]
+        if by in ("day", "month", "year"):
+            unit = {"day": "D", "month": "M", "year": "Y"}[by]
+            known = day != NO_DAY
+            keys = np.full(len(idx), NO_DAY, dtype=np.int64)
+            keys[known] = day[known].astype("datetime64[D]").astype(f"datetime64[{unit}]").astype(np.int64)
+            label = lambda k: "unknown" if k == NO_DAY else str(np.datetime64(int(k), unit))
+        else:
+            col = getattr(self, by)
+            keys = col.values[idx]
+            label = lambda k: col.words[k]
+        uniq, inc, exp, n = self.totals(idx, keys)
+        return [{"key": label(k), "income": float(i), "expense": float(e), "net": float(i - e), "rows": int(c)}
+                for k, i, e, c in zip(uniq, inc, exp, n)]
+
+LEDGER_COLS = LedgerColumns(LEDGER)
+if LEDGER is None:
+    LEDGER = LEDGER_COLS
 
+def _kpis(name: str, t: tuple) -> Dict[str, Any]:
+    income, expense, n = t
+    return {"income": income, "expense": expense, "net": income - expense, "rows": int(n), **({"bucket": name} if name else {})}
 
-# ---------------- Accounting (in-memory MVP) ----------------
-LEDGER = LEDGER if 'LEDGER' in globals() else []  # list of {date, description, amount, type, ts}
+# CSV uploads are parsed in chunks; each step below is a column operation on the whole chunk.
+LEDGER_CSV_CHUNK_ROWS = int(os.getenv("LEDGER_CSV_CHUNK_ROWS", "100000"))
+LEDGER_ERROR_SAMPLES = 20  # rejected rows echoed back per upload
+
+def _ledger_chunk(chunk: pd.DataFrame, first_row: int, errors: Dict[str, int], samples: List[Dict[str, Any]]) -> pd.DataFrame:
+    # raw CSV chunk (all str) -> normalized ledger frame; rows with a missing/bad amount are counted and dropped
+    chunk.columns = [str(c).strip().lower() for c in chunk.columns]
+    blank = pd.Series("", index=chunk.index)
+    col = lambda name: chunk[name].str.strip() if name in chunk else blank
+    raw = col("amount")
+    amount = pd.to_numeric(raw, errors="coerce").astype(float)  # float even when a chunk is all whole numbers
+    missing = raw == ""
+    bad = ~missing & ~np.isfinite(amount)
+    for kind, mask in (("missing_amount", missing), ("bad_amount", bad)):
+        errors[kind] += int(mask.sum())
+        for i in np.flatnonzero(mask.to_numpy())[:max(0, LEDGER_ERROR_SAMPLES - len(samples))]:
+            samples.append({"row": first_row + int(i), "error": kind, "value": raw.iat[i]})
+    typ = col("type").str.lower()
+    # guess by sign if missing
+    typ = typ.where(typ.isin(["income", "expense"]), np.where(amount >= 0, "income", "expense"))
+    desc = col("description")
+    df = pd.DataFrame({
+        "date": col("date"),
+        "description": desc.where(desc != "", col("desc")),
+        "amount": amount,
+        "type": typ,
+        "category": col("category").replace("", "uncategorized"),
+    })[~(missing | bad)]
+    df.insert(0, "id", new_id.many(len(df)))
+    df["ts"] = int(time.time())
+    return df
 
 @app.post("/acct/ingest_csv")
 def acct_ingest_csv(file: UploadFile = File(...), user=Depends(get_current_user)):
-    import csv, io, time
+    t0 = time.perf_counter()
+    errors = {"missing_amount": 0, "bad_amount": 0}
+    samples: List[Dict[str, Any]] = []
+    added = seen = 0
     try:
-        raw = file.file.read()
-        txt = raw.decode("utf-8", errors="ignore")
-    except Exception:
-        raise HTTPException(status_code=400, detail="Could not read file")
-
-    reader = csv.DictReader(io.StringIO(txt))
-    added = 0
-    for row in reader:
-        # Normalize keys
-        r = {k.lower().strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
-        date = r.get("date") or ""
-        desc = r.get("description") or r.get("desc") or ""
-        try:
-            amount = float(r.get("amount", 0) or 0)
-        except Exception:
-            amount = 0.0
-        typ = (r.get("type") or "").lower()
-        if typ not in ("income", "expense"):
-            # guess by sign if missing
-            typ = "income" if amount >= 0 else "expense"
-        LEDGER.append({"date": date, "description": desc, "amount": amount, "type": typ, "ts": int(time.time())})
-        added += 1
-    return {"ok": True, "rows_added": added, "total_rows": len(LEDGER)}
+        for chunk in pd.read_csv(file.file, dtype=str, keep_default_na=False, chunksize=LEDGER_CSV_CHUNK_ROWS,
+                                 encoding="utf-8", encoding_errors="ignore"):
+            df = _ledger_chunk(chunk, seen + 1, errors, samples)
+            seen += len(chunk)
+            if len(df):
+                cols = list(df.columns)  # zip over plain lists; DataFrame.to_dict boxes every cell
+                rows = [dict(zip(cols, vals)) for vals in zip(*(df[c].tolist() for c in cols))]
+                added += LEDGER.insert_many(rows, then=lambda conn: LEDGER_TOTALS.add(df, conn))
+    except pd.errors.EmptyDataError:
+        pass
+    except (pd.errors.ParserError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse CSV after {added} rows were added: {e}")
+    finally:
+        if added:  # one event per upload, not per row
+            publish("ledger", "bulk", count=added)
+    secs = time.perf_counter() - t0
+    return {"ok": True, "rows_added": added, "rows_rejected": seen - added, "errors": errors,
+            "error_samples": sorted(samples, key=lambda e: e["row"]),
+            "seconds": round(secs, 3), "rows_per_sec": round(seen / secs) if secs > 0 else None, "total_rows": len(LEDGER)}
 
 @app.get("/acct/ledgers")
-def acct_ledgers(user=Depends(get_current_user)):
+def acct_ledgers(request: Request, response: Response, limit: int = PAGE_DEFAULT, cursor: Optional[str] = None,
+                 user=Depends(get_current_user)):
     # newest first
-    return sorted(LEDGER, key=lambda x: x.get("ts", 0), reverse=True)
+    return not_modified(request, response, LEDGER) or list_page(LEDGER, response, limit, cursor)
 
 @app.get("/accounting/kpis")
-def accounting_kpis(user=Depends(get_current_user)):
-    income = sum(x["amount"] for x in LEDGER if x.get("type") == "income")
-    expense = sum(x["amount"] for x in LEDGER if x.get("type") == "expense")
-    net = income - expense
-    return {"income": income, "expense": expense, "net": net, "rows": len(LEDGER)}
+def accounting_kpis(request: Request, response: Response, user=Depends(get_current_user)):
+    return not_modified(request, response, LEDGER) or _kpis("", LEDGER_TOTALS.get("all"))
+
+def _day_param(v: Optional[str], name: str) -> Optional[int]:
+    if not v:
+        return None
+    try:
+        return int(np.datetime64(v, "D").astype(np.int64))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be a date (YYYY-MM-DD)")
+
+@app.get("/accounting/range")
+def accounting_range(request: Request, response: Response, start: Optional[str] = None, end: Optional[str] = None,
+                     limit: int = PAGE_DEFAULT, offset: int = 0, user=Depends(get_current_user)):
+    # ledger rows with start <= date <= end, in date order, plus the totals of the whole range
+    hit = not_modified(request, response, LEDGER)
+    if hit:
+        return hit
+    idx = LEDGER_COLS.select(_day_param(start, "start"), _day_param(end, "end"))
+    _, inc, exp, n = LEDGER_COLS.totals(idx)
+    limit, offset = max(1, min(limit, PAGE_MAX)), max(0, offset)
+    return {**_kpis("", (float(inc[0]), float(exp[0]), int(n[0]))), "items": LEDGER_COLS.rows(idx[offset:offset + limit])}
+
+@app.get("/accounting/groupby")
+def accounting_groupby(request: Request, response: Response, by: str = "month", start: Optional[str] = None,
+                       end: Optional[str] = None, user=Depends(get_current_user)):
+    # per-key totals over an optional date range
+    if by not in ("day", "month", "year", "type", "category", "description"):
+        raise HTTPException(status_code=400, detail="by must be one of day, month, year, type, category, description")
+    hit = not_modified(request, response, LEDGER)
+    if hit:
+        return hit
+    idx = LEDGER_COLS.select(_day_param(start, "start"), _day_param(end, "end"))
+    return LEDGER_COLS.group(idx, by)
+
+@app.get("/accounting/summary")
+def accounting_summary(request: Request, response: Response, group_by: str = "month", user=Depends(get_current_user)):
+    # per-bucket KPIs, sorted by bucket name
+    if group_by not in ("month", "category"):
+        raise HTTPException(status_code=400, detail="group_by must be 'month' or 'category'")
+    hit = not_modified(request, response, LEDGER)
+    if hit:
+        return hit
+    buckets = LEDGER_TOTALS.buckets(group_by + ":")
+    return [_kpis(b, buckets[b]) for b in sorted(buckets)]
+
+
+# ---------------- Exports ----------------
+# Whole collections streamed in seq order, EXPORT_BATCH rows per store round trip, so memory
+# stays flat and the first bytes go out before the last rows are read.
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "5000"))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# collection -> (table, filterable fields, columns with their type for CSV/Parquet)
+EXPORTS = {
+    "ledger": (LEDGER, (), [("id", str), ("date", str), ("description", str), ("amount", float),
+                            ("type", str), ("category", str), ("ts", int)]),
+    "results": (RESULTS, ("exp_id",), [("id", str), ("exp_id", str), ("name", str), ("content_type", str),
+                                       ("sha256", str), ("bytes", int), ("ts", int)]),
+    "rfqs": (RFQS, ("vendor_id", "status"), [("id", str), ("vendor_id", str), ("vendor", str), ("item", str),
+                                             ("qty", int), ("currency", str), ("status", str), ("price", float),
+                                             ("lead_time_days", int), ("ts", int), ("decision_ts", int)]),
+}
+
+def _export_batches(tbl, eq: Dict[str, Any]):
+    # filters are equality on index columns, so only matching rows are read
+    seq = -1
+    while True:
+        batch = tbl.after(seq, EXPORT_BATCH, **eq)
+        if not batch:
+            return
+        seq = batch[-1][0]
+        yield [r for _, r in batch]
+
+class _Drain(io.RawIOBase):
+    # write-only sink whose contents are taken out after each Parquet row group
+    def __init__(self):
+        self.parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+def _export_ndjson(batches, cols):
+    for rows in batches:
+        yield "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in rows).encode()
+
+def _export_csv(batches, cols):
+    import csv
+    names = [c for c, _ in cols]
+    buf = io.StringIO()
+    w = csv.DictWriter(buf, fieldnames=names, extrasaction="ignore")
+    w.writeheader()
+    for rows in batches:
+        w.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0); buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+_ARROW_TYPES = {str: "string", float: "float64", int: "int64"}
+
+def _export_parquet(batches, cols, compression: str = "snappy"):
+    schema = pa.schema([(c, _ARROW_TYPES[t]) for c, t in cols])
+    sink = _Drain()
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for rows in batches:
+            writer.write_table(pa.Table.from_pydict({c: [r.get(c) for r in rows] for c, _ in cols}, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+def _gzip_stream(parts):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for p in parts:
+        out = z.compress(p)
+        if out:
+            yield out
+    yield z.flush()
+
+@app.get("/export/{collection}")
+def export(collection: str, format: str = "ndjson", gzip: bool = False,
+           exp_id: Optional[str] = None, vendor_id: Optional[str] = None, status: Optional[str] = None,
+           user=Depends(get_current_user)):
+    if collection not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown collection; one of {', '.join(EXPORTS)}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    tbl, fields, cols = EXPORTS[collection]
+    given = {"exp_id": exp_id, "vendor_id": vendor_id, "status": status}
+    eq = {c: v for c, v in given.items() if v is not None and c in fields}
+    batches = _export_batches(tbl, eq)
+    filename = f"{collection}.{format}"
+    if format == "parquet":
+        if pa is None:
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed on the API")
+        # Parquet compresses per page; gzip selects that codec instead of wrapping the file
+        body = _export_parquet(batches, cols, "gzip" if gzip else "snappy")
+        media = EXPORT_FORMATS[format]
+    else:
+        body = (_export_ndjson if format == "ndjson" else _export_csv)(batches, cols)
+        media = EXPORT_FORMATS[format]
+        if gzip:
+            body, media, filename = _gzip_stream(body), "application/gzip", filename + ".gz"
+    return StreamingResponse(body, media_type=media, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+# ---------------- Batch ----------------
+# Several GETs in one round trip. Each sub-query goes through the whole app in-process (auth,
+# rate limit, conditional 304s), all of them concurrently, so bootstrapping a tab costs one RTT.
+# Sub-queries are charged to the caller's rate limit like separate requests would be.
+BATCH_MAX = int(os.getenv("BATCH_MAX", "16"))
+BATCH_DENY = ("/batch", "/export")  # streamed bodies (these, downloads, /events) don't belong in a JSON envelope
+
+async def _subrequest(request: Request, q: Dict[str, Any]) -> Dict[str, Any]:
+    path, params = q.get("path"), q.get("params") or {}
+    out: Dict[str, Any] = {"id": q.get("id", path)}
+    if not isinstance(path, str) or not path.startswith("/") or path.startswith(BATCH_DENY) or path.endswith("/download") \
+            or path.rstrip("/") == "/events":
+        return {**out, "status": 400, "body": {"detail": "path not allowed in a batch"}}
+    if not isinstance(params, dict):
+        return {**out, "status": 400, "body": {"detail": "params must be an object"}}
+    headers = [(b"authorization", request.headers.get("authorization", "").encode("latin-1"))]
+    if q.get("etag"):
+        headers.append((b"if-none-match", str(q["etag"]).encode("latin-1")))
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": request.url.scheme, "path": path, "raw_path": path.encode(), "root_path": "",
+             "query_string": urlencode(params, doseq=True).encode(), "headers": headers,
+             "client": request.scope.get("client"), "server": request.scope.get("server")}
+    start: Dict[str, Any] = {}
+    chunks: List[bytes] = []
+    done, sent_request = asyncio.Event(), False
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(msg):
+        if msg["type"] == "http.response.start":
+            start.update(msg)
+        elif msg["type"] == "http.response.body":
+            chunks.append(msg.get("body", b""))
+            if not msg.get("more_body"):
+                done.set()
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # ServerErrorMiddleware has already answered 500 and re-raises for the server to log
+        if not start:
+            start["status"] = 500
+    finally:
+        done.set()
+    hdrs = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in start.get("headers", [])}
+    body = b"".join(chunks)
+    is_json = hdrs.get("content-type", "").startswith("application/json")
+    return {**out, "status": start["status"], "body": json.loads(body) if body and is_json else None,
+            "etag": hdrs.get("etag"), "next_cursor": hdrs.get("x-next-cursor")}
+
+@app.post("/batch")
+async def batch(request: Request, queries: str = Form(...), user=Depends(get_current_user)):
+    # queries: JSON list of {"id", "path", "params", "etag"}; answers come back in the same order
+    try:
+        qs = json.loads(queries)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="queries must be a JSON list")
+    if not isinstance(qs, list) or not all(isinstance(q, dict) for q in qs):
+        raise HTTPException(status_code=400, detail="queries must be a JSON list of objects")
+    if len(qs) > BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX} queries per batch")
+    return {"results": await asyncio.gather(*(_subrequest(request, q) for q in qs))}
+
+
+# ---------------- Change feed ----------------
+def _collections(v: Optional[str]) -> Optional[set]:
+    wanted = {c for c in (v or "").split(",") if c}
+    return wanted or None
+
+def _last_event_id(v: Optional[str], since: Optional[int]) -> Optional[int]:
+    try:
+        return int(v) if v else since
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Last-Event-ID must be an event id")
+
+@app.get("/events")
+async def events_stream(request: Request, since: Optional[int] = None, collections: Optional[str] = None,
+                        last_event_id: Optional[str] = Header(default=None), user=Depends(get_current_user)):
+    # Server-Sent Events: "id: <seq>", "event: <collection>", "data: <event JSON>"; a reconnect
+    # with Last-Event-ID (or ?since=) resumes after that event, no id starts at the current end.
+    # "event: reset" means the ids restarted (in-memory store) and the feed replays from the top.
+    wanted, seq = _collections(collections), _last_event_id(last_event_id, since)
+    admin = user.get("role") == "admin"
+    if seq is None:
+        seq = await run_in_threadpool(EVENTS.head)
+
+    async def stream():
+        nonlocal seq
+        loop, ev = asyncio.get_running_loop(), asyncio.Event()
+        with _EVENT_WAITERS_LOCK:
+            _EVENT_WAITERS.add((loop, ev))
+        try:
+            yield "retry: 3000\n\n"
+            idle = 0.0
+            while not await request.is_disconnected():
+                ev.clear()  # before reading, so a publish racing the read still wakes the wait below
+                events, seq, reset, more = await run_in_threadpool(events_after, seq, wanted, EVENTS_BATCH, admin)
+                if reset:
+                    yield "event: reset\ndata: {}\n\n"
+                for e in events:
+                    yield f"id: {e['seq']}\nevent: {e['collection']}\ndata: {json.dumps(e)}\n\n"
+                if events or more:
+                    idle = 0.0
+                    continue
+                try:
+                    await asyncio.wait_for(ev.wait(), EVENTS_POLL)
+                except asyncio.TimeoutError:
+                    idle += EVENTS_POLL
+                    if idle >= 15:  # comment line keeps proxies from closing an idle stream
+                        yield ": keep-alive\n\n"; idle = 0.0
+        finally:
+            with _EVENT_WAITERS_LOCK:
+                _EVENT_WAITERS.discard((loop, ev))
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
+@app.get("/events/poll")
+def events_poll(since: Optional[int] = None, collections: Optional[str] = None, limit: int = EVENTS_BATCH,
+                user=Depends(get_current_user)):
+    # -> {"events", "last": id to pass as `since` next time, "reset", "more"}; no `since` just returns the current end
+    events, last, reset, more = events_after(since, _collections(collections), max(1, min(limit, EVENTS_BATCH)),
+                                             admin=user.get("role") == "admin")
+    return {"events": events, "last": last, "reset": reset, "more": more}
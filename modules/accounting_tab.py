@@ -4,6 +4,14 @@ import pandas as pd
 import streamlit as st
 from modules import sdk
 
+def bootstrap():
+    # first-page reads of render(), fetched up front in app.py's single /batch call
+    if sdk.current_role() not in {"admin", "superadmin"}:
+        return []
+    return [("/accounting/kpis", None),
+            ("/accounting/summary", {"group_by": st.session_state.get("acct_group_by", "month")}),
+            ("/acct/ledgers", {"limit": 200})]
+
 def render():
     # Admin gate
     role = sdk.current_role()
@@ -21,9 +29,31 @@ def render():
     c3.metric("Net", f"{kpis.get('net',0):,.2f}")
     c4.metric("Rows", f"{kpis.get('rows',0)}")
 
+    group_by = st.radio("Summary by", ["month", "category"], horizontal=True, key="acct_group_by")
+    summary = sdk.api_get("/accounting/summary", params={"group_by": group_by}) or []
+    if summary:
+        sdf = pd.DataFrame(summary).set_index("bucket")
+        st.bar_chart(sdf[["income", "expense"]])
+        st.dataframe(sdf[["income", "expense", "net", "rows"]], use_container_width=True)
+
+    st.divider()
+    st.markdown("### Range report")
+    r1, r2, r3 = st.columns(3)
+    start = r1.date_input("From", value=None, key="acct_from")
+    end = r2.date_input("To", value=None, key="acct_to")
+    by = r3.selectbox("Group by", ["month", "day", "year", "category", "type", "description"], key="acct_by")
+    params = {"by": by, **({"start": start.isoformat()} if start else {}), **({"end": end.isoformat()} if end else {})}
+    groups = sdk.api_get("/accounting/groupby", params=params) or []
+    if groups:
+        gdf = pd.DataFrame(groups).set_index("key")
+        st.bar_chart(gdf[["income", "expense"]])
+        st.dataframe(gdf[["income", "expense", "net", "rows"]], use_container_width=True)
+    else:
+        st.caption("No ledger rows in this range.")
+
     st.divider()
     st.markdown("### Upload Transactions (CSV)")
-    st.caption("CSV headers (case-insensitive): date, description, amount, type (income|expense). Positive amounts can be auto-classified as income, negative as expense.")
+    st.caption("CSV headers (case-insensitive): date, description, amount, type (income|expense), optional category. Positive amounts can be auto-classified as income, negative as expense.")
     up = st.file_uploader("Choose CSV", type=["csv"])
     if st.button("Upload CSV"):
         if not up:
@@ -32,16 +62,24 @@ def render():
             res = sdk.api_post("/acct/ingest_csv", files={"file": (up.name, up.read())})
             if res and res.get("ok"):
                 st.success(f"Added {res.get('rows_added',0)} rows. Total: {res.get('total_rows',0)}")
+                st.caption(f"{res.get('rows_per_sec') or 0:,} rows/s in {res.get('seconds',0)} s")
+                if res.get("rows_rejected"):
+                    errs = ", ".join(f"{k}: {v}" for k, v in (res.get("errors") or {}).items() if v)
+                    st.warning(f"Rejected {res['rows_rejected']} rows ({errs}).")
+                    if res.get("error_samples"):
+                        st.dataframe(pd.DataFrame(res["error_samples"]), use_container_width=True, hide_index=True)
             else:
                 st.error("Upload failed. Check CSV format and try again.")
 
     st.divider()
     st.markdown("### Ledger")
-    rows = sdk.api_get("/acct/ledgers") or []
+    rows, more_rows = sdk.api_get_paged("acct_ledger", "/acct/ledgers", page_size=200)
     if rows:
         df = pd.DataFrame(rows)
         # Order columns if available
         cols = [c for c in ["date","description","amount","type","ts"] if c in df.columns] + [c for c in df.columns if c not in ["date","description","amount","type","ts"]]
         st.dataframe(df[cols], use_container_width=True, hide_index=True)
+        if more_rows: sdk.load_more_button("acct_ledger", "Load older rows")
+        sdk.export_widget("acct_export", "ledger")
     else:
         st.info("No ledger rows yet. Upload a CSV above.")
@@ -2,6 +2,8 @@ from __future__ import annotations
 import streamlit as st
 from modules import sdk
 
+PAGE_SIZE = 10
+
 def render():
     st.subheader("Knowledge")
 
@@ -22,12 +24,32 @@ def render():
     with search:
         st.markdown("**Search**")
         q = st.text_input("Query", placeholder="e.g., Raman ID/IG, BIS for solvents, KSUM grant…")
+        mode = st.radio("Match", ["keyword", "semantic"], horizontal=True,
+                        help="Semantic also finds paraphrases (e.g. 'D/G band intensity' for 'ID/IG ratio').")
         if st.button("Search") and q.strip():
-            hits = sdk.api_get("/knowledge/search", params={"q": q})
-            if not hits:
-                st.info("No matches.")
-                return
-            for h in hits:
-                st.markdown(f"**{h.get('title','(untitled)')}**")
-                st.code((h.get('snippet','') or '')[:800])
-                st.divider()
+            st.session_state["kn_q"] = q
+            st.session_state["kn_mode"] = mode
+            st.session_state["kn_offset"] = 0
+        q = st.session_state.get("kn_q")
+        if not q:
+            return
+        offset = st.session_state.get("kn_offset", 0)
+        # one extra hit tells us whether a next page exists
+        params = {"q": q, "mode": st.session_state.get("kn_mode", "keyword"), "limit": PAGE_SIZE + 1, "offset": offset}
+        hits = sdk.api_get("/knowledge/search", params=params) or []
+        if not hits:
+            st.info("No matches.")
+            return
+        for h in hits[:PAGE_SIZE]:
+            st.markdown(f"**{h.get('title','(untitled)')}**")
+            st.code((h.get('snippet','') or '')[:800])
+            st.divider()
+        prev_col, info_col, next_col = st.columns([1,2,1])
+        with prev_col:
+            if offset > 0 and st.button("← Prev"):
+                st.session_state["kn_offset"] = max(0, offset - PAGE_SIZE); st.rerun()
+        with info_col:
+            st.caption(f"Results {offset + 1}–{offset + min(len(hits), PAGE_SIZE)}")
+        with next_col:
+            if len(hits) > PAGE_SIZE and st.button("Next →"):
+                st.session_state["kn_offset"] = offset + PAGE_SIZE; st.rerun()
@@ -3,6 +3,12 @@ import pandas as pd
 import streamlit as st
 from modules import sdk
 
+def bootstrap():
+    # first-page reads of render(), fetched up front in app.py's single /batch call
+    if sdk.current_role() not in {"admin", "superadmin"}:
+        return []
+    return [("/ops/vendors", {"limit": 50}), ("/ops/rfq", {"limit": 50})]
+
 def render():
     # --- Admin gate ---
     role = sdk.current_role()
@@ -32,9 +38,10 @@ def render():
                     else:
                         st.error("Failed to add vendor.")
         # list vendors
-        vendors = sdk.api_get("/ops/vendors") or []
+        vendors, more_vendors = sdk.api_get_paged("proc_vendors", "/ops/vendors")
         if vendors:
             st.dataframe(pd.DataFrame(vendors), use_container_width=True, hide_index=True)
+            if more_vendors: sdk.load_more_button("proc_vendors", "Load more vendors")
         else:
             st.info("No vendors yet. Add one above.")
 
@@ -42,7 +49,7 @@ def render():
 
     # ========== RFQ Builder ==========
     with st.expander("RFQ Builder", expanded=True):
-        vendors = sdk.api_get("/ops/vendors") or []
+        # same (cached) vendor list as the directory above
         if not vendors:
             st.warning("Add a vendor first in Vendor Directory.")
         else:
@@ -66,14 +73,16 @@ def render():
 
     # ========== Quotes ==========
     st.markdown("### Quotes & Decisions")
-    rfqs = sdk.api_get("/ops/rfq") or []
+    rfqs, more_rfqs = sdk.api_get_paged("proc_rfqs", "/ops/rfq")
     if rfqs:
         df = pd.DataFrame(rfqs)
-# Ensure optional columns exist even before quoting
-for col in ["price","lead_time_days"]:
-    if col not in df.columns:
-        df[col] = None
-st.dataframe(df[["id","vendor","item","qty","currency","status","price","lead_time_days"]], use_container_width=True, hide_index=True)
+        # Ensure optional columns exist even before quoting
+        for col in ["price","lead_time_days"]:
+            if col not in df.columns:
+                df[col] = None
+        st.dataframe(df[["id","vendor","item","qty","currency","status","price","lead_time_days"]], use_container_width=True, hide_index=True)
+        if more_rfqs: sdk.load_more_button("proc_rfqs", "Load older RFQs")
+        sdk.export_widget("proc_export", "rfqs")
         c1, c2, c3 = st.columns([2,2,2])
         with c1:
             rfq_sel = st.selectbox("Select RFQ", [r["id"] for r in rfqs])
@@ -2,6 +2,16 @@ from __future__ import annotations
 import json, pandas as pd, streamlit as st
 from modules import sdk
 
+# files above this go through the resumable, parallel chunked upload; the largest file the
+# uploader accepts is server.maxUploadSize in .streamlit/config.toml
+RESUMABLE_MIN_BYTES = 16 * 1024 * 1024
+
+def bootstrap():
+    # first-page reads of render(), fetched up front in app.py's single /batch call
+    choice = st.session_state.get("list_exp_sel", "(all)")
+    return [("/rnd/experiments", {"limit": 50}),
+            ("/rnd/results", {"limit": 50} if choice == "(all)" else {"exp_id": choice, "limit": 50})]
+
 def render():
     st.subheader("R&D – Experiments & Results")
 
@@ -27,10 +37,11 @@ def render():
     st.markdown("### Experiments")
 
     # List experiments
-    exps = sdk.api_get("/rnd/experiments") or []
+    exps, more_exps = sdk.api_get_paged("rd_exps", "/rnd/experiments")
     if exps:
         df = pd.DataFrame(exps)
         st.dataframe(df[["id","title","status","ts"]], use_container_width=True)
+        if more_exps: sdk.load_more_button("rd_exps", "Load older experiments")
     else:
         st.info("No experiments yet. Create one above.")
 
@@ -63,7 +74,12 @@ def render():
                 if file is None:
                     st.warning("Choose a file first.")
                 else:
-                    res = sdk.api_post("/rnd/results/upload", data={"exp_id": exp_sel}, files={"file": (file.name, file.read())})
+                    if file.size > RESUMABLE_MIN_BYTES:
+                        bar = st.progress(0.0, text=f"Uploading {file.name}…")
+                        res = sdk.upload_resumable(exp_sel, file.name, file, file.size, file.type or "application/octet-stream",
+                                                   progress=lambda p: bar.progress(p))
+                    else:
+                        res = sdk.api_post("/rnd/results/upload", data={"exp_id": exp_sel}, files={"file": (file.name, file.read())})
                     if res and res.get("ok"):
                         st.success(f"Uploaded: {res['result']['name']}")
                     else:
@@ -75,8 +91,62 @@ def render():
         exp_ids = ["(all)"] + [e["id"] for e in exps]
         choice = st.selectbox("Show results for", exp_ids, key="list_exp_sel")
         params = None if choice == "(all)" else {"exp_id": choice}
-        data = sdk.api_get("/rnd/results", params=params) or []
+        data, more_results = sdk.api_get_paged("rd_results", "/rnd/results", params=params)
         if isinstance(data, list) and data:
             st.dataframe(pd.DataFrame(data), use_container_width=True)
+            if more_results: sdk.load_more_button("rd_results", "Load older results")
+            sdk.export_widget("rd_export", "results", params)
+            by_id = {r["id"]: r for r in data}
+            pick = st.selectbox("Result file", list(by_id), key="res_file_sel",
+                                format_func=lambda i: f"{by_id[i]['name']} ({by_id[i].get('bytes',0):,} bytes)")
+            b1, b2 = st.columns(2)
+            if b1.button("Preview first 4 KB", key="res_preview"):
+                head = sdk.api_download(f"/rnd/results/{pick}/download", byte_range=(0, 4095))
+                if head is not None:
+                    st.code(head.decode("utf-8", errors="replace"))
+            if b2.button("Fetch file", key="res_fetch"):
+                blob = sdk.api_download(f"/rnd/results/{pick}/download")
+                if blob is not None:
+                    st.download_button(f"Download {by_id[pick]['name']}", blob, file_name=by_id[pick]["name"], key="res_dl")
+            _series_view(by_id[pick])
         else:
             st.info("No results yet. Upload above.")
+
+    st.divider()
+    st.markdown("### Compare Across Experiments")
+    column = st.text_input("Numeric column", placeholder="e.g. ID/IG, tensile_strength", key="agg_col")
+    if column.strip():
+        agg = sdk.api_get("/rnd/series/aggregate", params={"column": column.strip()}) or {}
+        groups = agg.get("experiments") or []
+        if groups:
+            adf = pd.DataFrame(groups)
+            adf["experiment"] = adf["title"].fillna(adf["exp_id"])
+            st.bar_chart(adf.set_index("experiment")["mean"])
+            st.dataframe(adf[["experiment","results","count","mean","std","min","max"]], use_container_width=True, hide_index=True)
+        else:
+            st.caption("No parsed results have that column.")
+
+
+def _series_view(result):
+    """Stats and a downsampled chart of a parsed CSV/TSV result (only ~2000 points per column are fetched)."""
+    status = result.get("series")
+    if status == "pending":
+        st.caption("Parsing numeric columns…"); return
+    if status != "ready":
+        return
+    meta = sdk.api_get(f"/rnd/results/{result['id']}/series") or {}
+    cols = [c["name"] for c in meta.get("columns", [])]
+    if not cols:
+        return
+    st.caption(f"{meta.get('rows',0):,} rows parsed")
+    st.dataframe(pd.DataFrame(meta["columns"]).drop(columns=["sum","sumsq"], errors="ignore"), use_container_width=True, hide_index=True)
+    c1, c2, c3 = st.columns([1,2,1])
+    x = c1.selectbox("X", ["(row)"] + cols, key="series_x")
+    ys = c2.multiselect("Y", [c for c in cols if c != x], default=[c for c in cols if c != x][:1], key="series_y")
+    method = c3.selectbox("Downsample", ["lttb", "minmax"], key="series_method")
+    if ys:
+        params = {"y": ",".join(ys), "points": 2000, "method": method, **({"x": x} if x != "(row)" else {})}
+        data = sdk.api_get(f"/rnd/results/{result['id']}/series/data", params=params) or {}
+        for s in data.get("series", []):
+            st.caption(f"{s['y']}: {len(s['x']):,} of {s['points']:,} points")
+            st.line_chart(pd.DataFrame({s["y"]: s["values"]}, index=pd.Index(s["x"], name=x)))
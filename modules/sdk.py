@@ -1,34 +1,318 @@
 from __future__ import annotations
-import os, json, base64
-from typing import Any, Dict, Optional
+import os, json, time, base64, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 import requests, streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# HTTP client tuning (per UI process)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+
+# GET responses are cached per browser session for CACHE_TTL seconds, so reruns only refetch
+# what changed. A POST drops the cached GETs under its parent path ("/ops/rfq/quote" -> "/ops/rfq")
+# plus the related prefixes below; other users' changes are applied by sync_changes() on the next
+# rerun, or show up once the TTL runs out.
+# Expired or dropped entries keep their ETag and are revalidated with If-None-Match: when nothing
+# changed the API answers 304 with no body and the cached copy is reused.
+CACHE_TTL = float(os.getenv("SDK_CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = 256
+_INVALIDATES = {
+    "/rnd/experiments": ("/kpis",),
+    "/rnd/results": ("/rnd/series",),
+    "/rnd/uploads": ("/rnd/results", "/rnd/series"),
+    "/ops/vendors": ("/ops/rfq",),  # RFQ rows carry the vendor name
+    "/acct": ("/accounting",),
+    "/knowledge": ("/kpis",),
+}
+
+# Change feed (/events/poll) -> list endpoint whose cached pages are patched row by row.
+# Feeds without a list here expire the given prefixes instead; "bulk" events expire the list.
+_FEED_LISTS = {
+    "experiments": "/rnd/experiments",
+    "results": "/rnd/results",
+    "vendors": "/ops/vendors",
+    "rfqs": "/ops/rfq",
+    "ledger": "/acct/ledgers",
+}
+_FEED_EXPIRES = {"knowledge": ("/kpis", "/knowledge")}
 
 def _api_base() -> str:
-    return (os.getenv("API_BASE_URL") or "http://127.0.0.1:8000").rstrip("/")
+    url = os.getenv("API_BASE_URL")
+    if not url:
+        try:
+            url = st.secrets["API_BASE_URL"]  # type: ignore[index]
+        except Exception:
+            url = "http://127.0.0.1:8000"
+    return url.rstrip("/")
 
 def _headers() -> Dict[str, str]:
     t = st.session_state.get("token")
     return {"Authorization": f"Bearer {t}"} if t else {}
 
-def api_get(path: str, params: Optional[Dict[str, Any]] = None, timeout: int = 15):
+@st.cache_resource(show_spinner=False)
+def client() -> requests.Session:
+    """One keep-alive connection pool for the whole UI process, shared by every browser session
+    (auth is sent per request, never stored on the session). Connection failures are retried
+    for any method; 429/5xx answers only for idempotent ones, with exponential backoff."""
+    retry = Retry(total=HTTP_RETRIES, connect=HTTP_RETRIES, read=1, backoff_factor=0.3,
+                  status_forcelist=(429, 502, 503, 504), allowed_methods=frozenset({"GET", "HEAD", "PUT", "OPTIONS"}),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    s = requests.Session()
+    s.mount("http://", adapter); s.mount("https://", adapter)
+    return s
+
+def request(method: str, path: str, timeout: Any = 15, headers: Optional[Dict[str, str]] = None, **kw) -> requests.Response:
+    """Authenticated call through the pooled client; raises requests.RequestException."""
     if not path.startswith("/"): path = "/" + path
+    return client().request(method, _api_base()+path, headers={**_headers(), **(headers or {})}, timeout=timeout, **kw)
+
+def _norm(path: str) -> str:
+    return path if path.startswith("/") else "/" + path
+
+def _under(path: str, prefix: str) -> bool:
+    return path == prefix or path.startswith(prefix.rstrip("/") + "/")
+
+def _cache() -> Dict[tuple, tuple]:
+    return st.session_state.setdefault("_sdk_cache", {})
+
+def invalidate(*prefixes: str):
+    """Expire cached GETs whose path is (under) any of the given prefixes; no args expires everything.
+    The next read revalidates them, so an unchanged collection costs a 304 instead of a full body."""
+    cache = _cache()
+    for k in [k for k in cache if not prefixes or any(_under(k[0], p) for p in prefixes)]:
+        cache[k] = (0.0,) + cache[k][1:]
+
+def _invalidate_after_post(path: str):
+    parent = path.rsplit("/", 1)[0] or path
+    extra = [p for src, deps in _INVALIDATES.items() if _under(path, src) for p in deps]
+    invalidate(parent, *extra)
+
+def _key(path: str, params: Optional[Dict[str, Any]]) -> tuple:
+    return (path, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+
+def _store(key: tuple, out: tuple, etag: Optional[str], ttl: float):
+    cache = _cache()
+    if len(cache) >= CACHE_MAX_ENTRIES:
+        now = time.monotonic()
+        for k in [k for k, v in cache.items() if v[0] <= now] or list(cache)[:len(cache) // 2]:
+            del cache[k]
+    cache[key] = (time.monotonic() + ttl, out, etag)
+
+def _get(path: str, params: Optional[Dict[str, Any]] = None, timeout: int = 15, ttl: Optional[float] = None):
+    """-> (json body, next-page cursor) or None; answered from the session cache while fresh."""
+    path = _norm(path)
+    ttl = CACHE_TTL if ttl is None else ttl
+    key = _key(path, params)
+    hit = _cache().get(key) if ttl > 0 else None
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    etag = hit[2] if hit else None
     try:
-        r = requests.get(_api_base()+path, headers=_headers(), params=params, timeout=timeout)
+        r = request("GET", path, params=params, timeout=timeout, headers={"If-None-Match": etag} if etag else None)
         if r.status_code == 401:
             st.toast("Session expired. Please log in again."); st.session_state.clear(); st.rerun()
-        r.raise_for_status(); return r.json()
+        if r.status_code == 304 and hit:
+            out = hit[1]
+        else:
+            r.raise_for_status()
+            out, etag = (r.json(), r.headers.get("X-Next-Cursor")), r.headers.get("ETag")
     except requests.RequestException as e:
         st.info(f"⚠️ GET {path} failed: {e}"); return None
+    if ttl > 0:
+        _store(key, out, etag, ttl)
+    return out
+
+def api_batch(queries: List[Tuple[str, Optional[Dict[str, Any]]]], timeout: int = 30, ttl: Optional[float] = None) -> List[Any]:
+    """Fetch several (path, params) GETs in one /batch round trip -> parsed JSON per query (None on error).
+    Fresh cache hits are not sent, stale ones go out with their ETag, and the answers land in the
+    session cache, so api_get/api_get_paged calls with the same path and params are then served locally."""
+    ttl = CACHE_TTL if ttl is None else ttl
+    keys = [_key(_norm(p), q) for p, q in queries]
+    cache, now = _cache(), time.monotonic()
+    hits = [cache.get(k) if ttl > 0 else None for k in keys]
+    todo = [i for i, h in enumerate(hits) if not (h and h[0] > now)]
+    bodies = [None if i in todo else h[1][0] for i, h in enumerate(hits)]
+    if todo:
+        body = [{"id": i, "path": keys[i][0], "params": queries[i][1] or {}, **({"etag": hits[i][2]} if hits[i] and hits[i][2] else {})}
+                for i in todo]
+        try:
+            r = request("POST", "/batch", data={"queries": json.dumps(body)}, timeout=timeout)
+            if r.status_code == 401:
+                st.toast("Session expired. Please log in again."); st.session_state.clear(); st.rerun()
+            r.raise_for_status(); answers = r.json()["results"]
+        except (requests.RequestException, ValueError, KeyError):
+            answers = []  # older API or flaky link: callers fall back to their own GETs
+        for a in answers:
+            i = a["id"]
+            if a["status"] == 304 and hits[i]:
+                out, etag = hits[i][1], hits[i][2]
+            elif a["status"] == 200:
+                out, etag = (a["body"], a.get("next_cursor")), a.get("etag")
+            else:
+                continue
+            bodies[i] = out[0]
+            if ttl > 0: _store(keys[i], out, etag, ttl)
+    return bodies
+
+def _apply_event(e: Dict[str, Any]):
+    path = _FEED_LISTS.get(e["collection"])
+    if path is None:
+        if _FEED_EXPIRES.get(e["collection"]): invalidate(*_FEED_EXPIRES[e["collection"]])
+        return
+    derived = [p for src, deps in _INVALIDATES.items() if _under(path, src) for p in deps]
+    if derived: invalidate(*derived)
+    cache = _cache()
+    for k, (expiry, (rows, cursor), etag) in list(cache.items()):
+        if k[0] != path: continue
+        params = dict(k[1])
+        if e["op"] not in ("insert", "update", "delete") or set(params) - {"limit", "cursor"} or not isinstance(rows, list):
+            cache[k] = (0.0, (rows, cursor), etag)  # filtered view: the row may enter or leave it, refetch
+            continue
+        at = next((i for i, x in enumerate(rows) if x.get("id") == e["id"]), None)
+        rows = list(rows)
+        if e["op"] == "delete":
+            if at is not None: del rows[at]
+        elif at is not None:
+            rows[at] = e["row"]
+        elif e["op"] == "insert" and "cursor" not in params:
+            rows.insert(0, e["row"])  # newest first; older pages keep their cursors
+        cache[k] = (expiry, (rows, cursor), etag)
+
+def sync_changes(timeout: int = 5) -> int:
+    """Catch the session cache up with writes made anywhere (other users, other tabs) through the
+    API's change feed: cached first pages of lists get the new/changed rows patched in, filtered
+    lists and derived reports are expired. One small request per rerun -> number of events applied."""
+    since = st.session_state.get("_sdk_feed")
+    applied = 0
+    while True:
+        try:
+            r = request("GET", "/events/poll", params={} if since is None else {"since": since}, timeout=timeout)
+            r.raise_for_status(); feed = r.json()
+        except (requests.RequestException, ValueError):
+            return applied  # feed unavailable: the TTL still bounds staleness
+        first, since = since is None, feed["last"]
+        st.session_state["_sdk_feed"] = since
+        if first: return 0  # just marks the position; the cache is empty or already current
+        if feed.get("reset"):
+            invalidate(); return applied
+        for e in feed["events"]:
+            _apply_event(e); applied += 1
+        if not feed.get("more"): return applied
+
+def api_get(path: str, params: Optional[Dict[str, Any]] = None, timeout: int = 15, ttl: Optional[float] = None):
+    """GET -> parsed JSON (or None); cached for `ttl` seconds (default CACHE_TTL, 0 = always fetch)."""
+    hit = _get(path, params, timeout, ttl)
+    return hit[0] if hit is not None else None
+
+def api_get_page(path: str, params: Optional[Dict[str, Any]] = None, timeout: int = 15) -> Tuple[Optional[List[Any]], Optional[str]]:
+    """One page of a list endpoint -> (rows, cursor of the next page or None)."""
+    hit = _get(path, params, timeout)
+    if hit is None: return None, None
+    return hit
+
+def api_get_paged(key: str, path: str, params: Optional[Dict[str, Any]] = None, page_size: int = 50) -> Tuple[List[Any], bool]:
+    """Newest rows of a list endpoint, as many pages as "Load more" asked for -> (rows, more available)."""
+    rows: List[Any] = []; cursor = None
+    for _ in range(st.session_state.get(f"{key}_pages", 1)):
+        q = dict(params or {}, limit=page_size)
+        if cursor: q["cursor"] = cursor
+        batch, cursor = api_get_page(path, q)
+        rows.extend(batch or [])
+        if not cursor: break
+    return rows, cursor is not None
+
+def api_download(path: str, params: Optional[Dict[str, Any]] = None, timeout: Tuple[int, int] = (5, 120),
+                 byte_range: Optional[Tuple[int, int]] = None) -> Optional[bytes]:
+    """Stream a large response body; the read timeout applies per chunk, not to the whole download.
+    byte_range=(first, last) asks for just that inclusive slice of the file."""
+    headers = {"Range": f"bytes={byte_range[0]}-{byte_range[1]}"} if byte_range else {}
+    try:
+        with request("GET", path, headers=headers, params=params, timeout=timeout, stream=True) as r:
+            r.raise_for_status()
+            return b"".join(r.iter_content(1 << 16))
+    except requests.RequestException as e:
+        st.info(f"⚠️ GET {path} failed: {e}"); return None
+
+def upload_resumable(exp_id: str, name: str, f, size: int, content_type: str = "application/octet-stream",
+                     workers: int = 4, attempts: int = 5, progress=None) -> Optional[Dict[str, Any]]:
+    """Upload a large result through /rnd/uploads: chunks go out in parallel, and after a failure
+    only the byte ranges the API reports as missing are re-sent. Returns the finalize response.
+    `f` is a seekable binary file; it is hashed and sent one block at a time, never read whole."""
+    h = hashlib.sha256(); f.seek(0)
+    for block in iter(lambda: f.read(1024 * 1024), b""):
+        h.update(block)
+    init = api_post("/rnd/uploads", data={"exp_id": exp_id, "name": name, "size": size, "content_type": content_type,
+                                          "sha256": h.hexdigest()})
+    if not init or not init.get("ok"): return None
+    up = init["upload"]; uid, size, step = up["id"], up["size"], up["chunk_size"]
+    session, base, headers = client(), _api_base(), _headers()  # worker threads must not touch st.*
+    lock = threading.Lock()  # one file position shared by the sender threads
+
+    def read(start: int, end: int) -> bytes:
+        with lock:
+            f.seek(start)
+            return f.read(end - start)
+
+    def send(span) -> bool:
+        start, end = span
+        try:
+            r = session.put(f"{base}/rnd/uploads/{uid}/chunks/{start // step}", params={"offset": start},
+                            data=read(start, end), headers=headers, timeout=(5, 120))
+            return r.ok
+        except requests.RequestException:
+            return False
+
+    missing = [[0, size]]
+    for attempt in range(attempts):
+        spans = [(a, min(a + step, b)) for a0, b in missing for a in range(a0, b, step)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sent = 0
+            for ok in pool.map(send, spans):
+                sent += ok
+                if progress: progress(min(1.0, sent / max(1, len(spans))))
+        status = api_get(f"/rnd/uploads/{uid}", ttl=0)
+        if status is None: return None
+        missing = status["missing"]
+        if not missing: break
+        time.sleep(min(30, 2 ** attempt))  # rate limited or flaky link: back off, then resend the gaps
+    else:
+        st.info(f"⚠️ Upload incomplete after {attempts} attempts; missing {missing[:3]}"); return None
+    return api_post(f"/rnd/uploads/{uid}/finalize", timeout=300)
+
+def export_widget(key: str, collection: str, params: Optional[Dict[str, Any]] = None):
+    """Format picker + button that pulls /export/<collection> and offers it as a download."""
+    c1, c2, c3 = st.columns([2,1,1])
+    fmt = c1.selectbox("Export format", ["csv", "ndjson", "parquet"], key=f"{key}_fmt")
+    gz = c2.checkbox("gzip", key=f"{key}_gz")
+    if c3.button("Prepare export", key=f"{key}_prep"):
+        data = api_download(f"/export/{collection}", dict(params or {}, format=fmt, gzip=gz))
+        if data is not None:
+            name = f"{collection}.{fmt}" + (".gz" if gz and fmt != "parquet" else "")
+            st.session_state[f"{key}_file"] = (name, data)
+    if f"{key}_file" in st.session_state:
+        name, data = st.session_state[f"{key}_file"]
+        st.download_button(f"Download {name}", data, file_name=name, key=f"{key}_dl")
+
+def load_more_button(key: str, label: str = "Load more"):
+    """Button that makes the next api_get_paged(key, ...) fetch one more page."""
+    if st.button(label, key=f"{key}_more"):
+        st.session_state[f"{key}_pages"] = st.session_state.get(f"{key}_pages", 1) + 1; st.rerun()
 
 def api_post(path: str, data: Optional[Dict[str, Any]] = None, files: Optional[Dict[str, Any]] = None, timeout: int = 30):
-    if not path.startswith("/"): path = "/" + path
+    path = _norm(path)
     try:
-        r = requests.post(_api_base()+path, headers=_headers(), data=data, files=files, timeout=timeout)
+        r = request("POST", path, data=data, files=files, timeout=timeout)
         if r.status_code == 401:
             st.toast("Session expired. Please log in again."); st.session_state.clear(); st.rerun()
         r.raise_for_status(); return r.json()
     except requests.RequestException as e:
         st.info(f"⚠️ POST {path} failed: {e}"); return None
+    finally:
+        # even a failed POST may have changed something server-side
+        if "token" in st.session_state: _invalidate_after_post(path)
 
 def current_role() -> str:
     token = st.session_state.get("token","")
@@ -40,3 +324,13 @@ def current_role() -> str:
         return (json.loads(payload).get("role") or "user")
     except Exception:
         return "user"
+
+def login(username: str, password: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """POST /login -> (token payload, None) or (None, error message for the UI)."""
+    try:
+        r = client().post(_api_base()+"/login", data={"username": username, "password": password}, timeout=15)
+    except requests.RequestException as e:
+        return None, f"Login endpoint unavailable: {e}"
+    if r.status_code != 200:
+        return None, "Login failed. Check credentials."
+    return r.json(), None
@@ -40,4 +40,14 @@ def render():
             st.success(f"User created: {new_user} ({new_role})")
         else:
             st.error("Failed to create user (check logs/role/auth).")
+
+    with st.form("delete_user_form"):
+        del_user = st.text_input("Username to delete")
+        deleted = st.form_submit_button("Delete User")
+    if deleted:
+        res = sdk.api_post("/admin/users/delete", data={"username": del_user})
+        if res and res.get("ok"):
+            st.success(f"User deleted: {del_user}")
+        else:
+            st.error("Failed to delete user (check logs/role/auth).")
 # -- ADMIN USERS END --
@@ -0,0 +1,41 @@
+import os, sys, multiprocessing
+
+os.environ.setdefault("DATA_DIR", "")  # in-memory storage; nothing written next to the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def _worker_of(gen, out, done=None):
+    gen()
+    out.put(gen.worker)
+    if done is not None:
+        done.wait(10)  # keep the slot while the other workers pick theirs
+
+
+def test_forked_workers_lease_distinct_worker_ids(tmp_path):
+    gen = main.IdGenerator(0, str(tmp_path))
+    gen()  # the parent holds a slot too, as a master that touched ids before forking would
+    ctx = multiprocessing.get_context("fork")
+    out, done = ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=_worker_of, args=(gen, out, done)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    workers = [out.get(timeout=10) for _ in procs]
+    done.set()
+    for p in procs:
+        p.join()
+    assert len(set(workers + [gen.worker])) == 5
+
+
+def test_worker_slot_is_freed_when_its_process_exits(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    for _ in range(3):
+        p = ctx.Process(target=_worker_of, args=(main.IdGenerator(0, str(tmp_path)), out))
+        p.start(); p.join()
+        assert out.get(timeout=10) == 0
+
+
+def test_ids_are_unique_and_ordered():
+    ids = main.new_id.many(10000)
+    assert len(set(ids)) == len(ids) and ids == sorted(ids)
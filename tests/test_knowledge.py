@@ -0,0 +1,70 @@
+import io, os, sys
+
+os.environ.setdefault("DATA_DIR", "")  # in-memory storage; nothing written next to the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def _ingest(store, name, text):
+    return store.ingest(name, io.BytesIO(text.encode()))
+
+
+def test_segments_held_by_a_reader_survive_a_merge(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "KNOWLEDGE_MERGE_FACTOR", 2)
+    writer = main.KnowledgeStore(str(tmp_path))
+    _ingest(writer, "a.txt", "alpha electrolyser")
+    reader = main.KnowledgeStore(str(tmp_path))
+    snap = reader.segments
+    _ingest(writer, "b.txt", "beta electrolyser")  # merges seg-000001 away
+    assert not os.path.exists(snap[0].path)
+    assert snap[0].chunk_doc(0)["name"] == "a.txt"
+    assert snap[0].chunk_text(0) == "alpha electrolyser"
+    assert sorted(d["name"] for _, d, _, _ in reader.search("electrolyser", 10)) == ["a.txt", "b.txt"]
+
+
+def _long(word, n):
+    # about n chunks of text that all mention `word`
+    return " ".join(f"{word} sample {i} " + "filler " * 280 for i in range(n))
+
+
+def test_large_docs_are_flushed_into_several_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "KNOWLEDGE_FLUSH_CHUNKS", 2)
+    monkeypatch.setattr(main, "KNOWLEDGE_MERGE_FACTOR", 100)
+    store = main.KnowledgeStore(str(tmp_path))
+    doc = _ingest(store, "big.txt", _long("electrolyser", 5))
+    assert doc["chunks"] >= 5 and len(store.segments) == (doc["chunks"] + 1) // 2
+    assert [s.base for s in store.segments] == list(range(0, doc["chunks"], 2))
+    assert store.n_chunks == doc["chunks"] and len(store) == 1
+    hits = store.search("electrolyser sample 4", 5)
+    assert [d["name"] for _, d, _, _ in hits] == ["big.txt"] and "electrolyser sample 4" in hits[0][2]
+
+
+def test_merges_keep_every_doc_searchable(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "KNOWLEDGE_MERGE_FACTOR", 2)
+    store = main.KnowledgeStore(str(tmp_path))
+    for i in range(8):
+        _ingest(store, f"{i}.txt", f"common term plus unique{i}")
+    assert len(store.segments) == 1 and store.segments[0].level == 3  # 8 -> 4 -> 2 -> 1
+    assert sorted(os.listdir(tmp_path)) == sorted(["LOCK", "manifest.json", "digests.jsonl",
+                                                   os.path.basename(store.segments[0].path)])
+    assert len(store.search("common term", 20)) == 8
+    for i in range(8):
+        assert [d["name"] for _, d, _, _ in store.search(f"unique{i}", 5)] == [f"{i}.txt"]
+
+
+def test_reopened_store_has_the_same_docs_and_digests(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "KNOWLEDGE_MERGE_FACTOR", 3)
+    store = main.KnowledgeStore(str(tmp_path))
+    docs = [_ingest(store, f"{i}.txt", f"reactor note {i}") for i in range(4)]
+    again = main.KnowledgeStore(str(tmp_path))
+    assert len(again) == 4 and again.n_chunks == store.n_chunks
+    assert [s.path for s in again.segments] == [s.path for s in store.segments]
+    assert sorted(d["name"] for _, d, _, _ in again.search("reactor note", 10)) == [f"{i}.txt" for i in range(4)]
+    dup = _ingest(again, "0.txt", "reactor note 0")
+    assert dup["duplicate"] and dup["id"] == docs[0]["id"] and len(again) == 4
+    alias = _ingest(again, "copy.txt", "reactor note 0")
+    assert alias["duplicate"] and alias["name"] == "copy.txt" and alias["ref"] == docs[0]["id"]
+    third = main.KnowledgeStore(str(tmp_path))
+    assert _ingest(third, "copy.txt", "reactor note 0")["id"] == alias["id"]
+    _ingest(third, "new.txt", "reactor note new")  # the writer picks up where the others left off
+    assert len(main.KnowledgeStore(str(tmp_path))) == 5
@@ -0,0 +1,109 @@
+import os, sys, threading, socketserver
+
+os.environ.setdefault("DATA_DIR", "")  # in-memory storage; nothing written next to the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+class _RedisStandIn(socketserver.ThreadingTCPServer):
+    # just enough of the Redis protocol for RedisLimiter: INCRBY, DECRBY, EXPIRE, AUTH, SELECT
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RespHandler)
+        self.data, self.lock = {}, threading.Lock()
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def _command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            n = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(n + 2)[:-2].decode())
+        return args
+
+    def handle(self):
+        while True:
+            cmd = self._command()
+            if cmd is None:
+                return
+            name = cmd[0].upper()
+            with self.server.lock:
+                if name in ("INCRBY", "DECRBY"):
+                    step = int(cmd[2]) if name == "INCRBY" else -int(cmd[2])
+                    v = self.server.data[cmd[1]] = self.server.data.get(cmd[1], 0) + step
+                    self.wfile.write(b":%d\r\n" % v)
+                elif name == "EXPIRE":
+                    self.wfile.write(b":1\r\n")
+                elif name in ("AUTH", "SELECT"):
+                    self.wfile.write(b"+OK\r\n")
+                else:
+                    self.wfile.write(b"-ERR unknown command\r\n")
+
+
+def _serve():
+    srv = _RedisStandIn()
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"redis://127.0.0.1:{srv.server_address[1]}/0"
+
+
+def test_redis_limiter_shares_one_budget_between_workers():
+    srv, url = _serve()
+    try:
+        workers = [main.RedisLimiter(url, per_min=10, burst=2, lease=3) for _ in range(2)]
+        now = 1_000_020.0  # mid-window, so the test never straddles a window boundary
+        granted = sum(workers[i % 2].take("1.2.3.4", now) for i in range(40))
+        assert granted == 12
+        assert workers[0].take("5.6.7.8", now) == 1  # other keys have their own budget
+    finally:
+        srv.shutdown(); srv.server_close()
+
+
+def test_redis_limiter_charges_spaced_requests_one_token_each():
+    srv, url = _serve()
+    try:
+        lim = main.RedisLimiter(url, per_min=10, burst=2, lease=3)
+        start = 1_000_020.0  # start of a window
+        spaced = [lim.take("1.2.3.4", start + 1.1 * i) for i in range(8)]
+        assert spaced == [1] * 8
+        burst = sum(lim.take("1.2.3.4", start + 10.0) for _ in range(20))
+        assert burst == 4  # 12 per window, 8 already spent
+        assert srv.data["rl:1.2.3.4:%d" % (start // 60)] == 12
+    finally:
+        srv.shutdown(); srv.server_close()
+
+
+def test_redis_limiter_falls_back_to_local_bucket_when_unreachable():
+    srv, url = _serve()
+    srv.shutdown(); srv.server_close()
+    lim = main.RedisLimiter(url, per_min=10, burst=2)
+    results = []
+
+    def hammer():
+        results.extend(lim.take("9.9.9.9", 1_000_020.0) for _ in range(20))
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(results) == 12
+
+
+def test_sqlite_limiter_shares_one_budget_between_workers(tmp_path):
+    path = str(tmp_path / "rl.db")
+    workers = [main.SQLiteLimiter(path, per_min=10, burst=2, lease=3) for _ in range(2)]
+    granted = sum(workers[i % 2].take("1.2.3.4", 1000.0) for i in range(40))
+    assert granted == 12
+
+
+def test_sqlite_limiter_matches_a_local_bucket_for_spaced_requests(tmp_path):
+    lim = main.SQLiteLimiter(str(tmp_path / "rl.db"), per_min=10, burst=2, lease=3)
+    ref = main.TokenBucket(per_min=10, burst=2)
+    times = [1000.0 + 1.1 * i for i in range(8)] + [1010.0] * 20
+    got = [lim.take("1.2.3.4", t) for t in times]
+    assert got == [ref.take("1.2.3.4", t) for t in times]
@@ -0,0 +1,36 @@
+import io, os, sys, threading
+
+os.environ.setdefault("DATA_DIR", "")  # in-memory storage; nothing written next to the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+import main
+
+TEXTS = ["hydrogen electrolyser stack degradation", "carbon capture sorbent regeneration energy",
+         "battery cathode nickel cobalt supply", "solar wafer kerf loss and yield"]
+
+
+def _wait(sem):
+    if sem._fitting is not None:
+        sem._fitting.join(30)
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_new_chunks_are_folded_in_off_the_query_path(tmp_path, monkeypatch, on_disk):
+    store = main.KnowledgeStore(str(tmp_path / "kb") if on_disk else "")
+    sem = main.SemanticIndex(store, str(tmp_path / "sem") if on_disk else "")
+    for i, t in enumerate(TEXTS):
+        store.ingest(f"{i}.txt", io.BytesIO(t.encode()))
+    assert not sem.ready()  # first query starts the fit in the background
+    _wait(sem)
+    assert sem.ready() and len(sem.vectors) == len(TEXTS)
+
+    store.ingest("new.txt", io.BytesIO(b"perovskite tandem solar wafer efficiency"))
+    embedded = []
+    real = sem._embed
+    on_query_thread = lambda: threading.current_thread() is threading.main_thread()
+    monkeypatch.setattr(sem, "_embed", lambda texts: (on_query_thread() and embedded.append(texts)) or real(texts))
+    sem.search("solar wafer", 5)
+    assert embedded == [["solar wafer"]]  # only the query; the new chunk is left to the background thread
+    _wait(sem)
+    assert len(sem.vectors) == len(TEXTS) + 1
+    assert "new.txt" in [d["name"] for _, d, _, _ in sem.search("solar wafer", 5)]
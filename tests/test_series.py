@@ -0,0 +1,33 @@
+import io, os, sys, json
+
+os.environ.setdefault("DATA_DIR", "")  # in-memory storage; nothing written next to the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+import main
+
+
+def test_series_are_parsed_chunk_by_chunk_into_loadable_columns(monkeypatch):
+    monkeypatch.setattr(main, "SERIES_CHUNK_ROWS", 7)
+    rng = np.random.default_rng(0)
+    t, v = np.arange(50) * 0.5, rng.normal(3.0, 2.0, 50)
+    lines = ["time,voltage,label"] + [f"{a},{float(b)!r},x{i}" for i, (a, b) in enumerate(zip(t, v))]
+    lines[10] = "4.5,bad,x9"
+    sha, _, _ = main.BLOB_STORE.put(io.BytesIO("\n".join(lines).encode()))
+    assert main._parse_series(sha) == "ready"
+    with open(os.path.join(main._series_dir(sha), "meta.json")) as f:
+        meta = json.load(f)
+    assert meta["rows"] == 50 and [c["name"] for c in meta["columns"]] == ["time", "voltage"]
+    volts = main._series_col(sha, meta, "voltage")
+    assert np.isnan(volts[9]) and np.allclose(np.delete(volts, 9), np.delete(v, 9), rtol=1e-15, atol=0)
+    ok = np.delete(v, 9)
+    col = meta["columns"][1]
+    assert col["count"] == 49 and np.isclose(col["min"], ok.min()) and np.isclose(col["max"], ok.max())
+    assert np.isclose(col["mean"], ok.mean()) and np.isclose(col["std"], ok.std())
+    assert np.isclose(col["sumsq"], np.square(ok).sum())
+    assert np.array_equal(main._series_col(sha, meta, "TIME"), t)
+
+
+def test_series_without_numeric_columns_leave_nothing_behind():
+    sha, _, _ = main.BLOB_STORE.put(io.BytesIO(b"name,kind\nfoo,bar\nbaz,qux\n"))
+    assert main._parse_series(sha) == "none"
+    assert os.listdir(main.BLOB_STORE.tmp) == []
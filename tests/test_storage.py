@@ -0,0 +1,96 @@
+import os, sys
+
+os.environ.setdefault("DATA_DIR", "")  # in-memory storage; nothing written next to the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+import main
+
+KINDS = ["memory", "sqlite"]
+
+
+def _table(kind, tmp_path, name="rows"):
+    if kind == "memory":
+        return main.MemoryTable(name, key="id", indexes=("ts", "exp_id", "status"))
+    pool = main._SqlitePool(str(tmp_path / "t.db"))
+    return main.SqliteTable(pool, name, key="id", indexes=("ts", "exp_id", "status"))
+
+
+def _fill(tbl, n=30):
+    rows = [{"id": f"r{i:03d}", "exp_id": f"e{i % 3}", "status": "open" if i % 2 else "done", "ts": 1000 + i}
+            for i in range(n)]
+    tbl.insert_many(rows)
+    return rows
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_insert_get_and_writes(kind, tmp_path):
+    tbl = _table(kind, tmp_path)
+    v0 = tbl.version()[0]
+    tbl.insert({"id": "a", "exp_id": "e1", "status": "open", "ts": 1})
+    assert tbl.version()[0] != v0
+    with pytest.raises(KeyError):
+        tbl.insert({"id": "a", "exp_id": "e2", "status": "open", "ts": 2})
+    assert tbl.get("a")["exp_id"] == "e1" and "a" in tbl and len(tbl) == 1
+    tbl.put({"id": "a", "exp_id": "e2", "status": "open", "ts": 1})
+    assert tbl.find(exp_id="e2") == [tbl.get("a")] and tbl.find(exp_id="e1") == []
+    assert tbl.update("a", {"status": "done"})["status"] == "done"
+    assert [r["id"] for r in tbl.find(status="done")] == ["a"]
+    assert tbl.update("missing", {"status": "done"}) is None
+    assert tbl.delete("a") and not tbl.delete("a") and len(tbl) == 0
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_page_walks_every_row_once_newest_first(kind, tmp_path):
+    tbl = _table(kind, tmp_path)
+    rows = _fill(tbl)
+    seen, before = [], None
+    while True:
+        page, before = tbl.page(7, before)
+        seen += [r["id"] for r in page]
+        if before is None:
+            break
+    assert seen == [r["id"] for r in reversed(rows)]
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_page_with_filters_and_ts_range(kind, tmp_path):
+    tbl = _table(kind, tmp_path)
+    rows = _fill(tbl)
+    want = [r["id"] for r in reversed(rows) if r["exp_id"] == "e1" and r["status"] == "open" and 1005 <= r["ts"] <= 1025]
+    seen, before = [], None
+    while True:
+        page, before = tbl.page(2, before, ts_min=1005, ts_max=1025, exp_id="e1", status="open")
+        seen += [r["id"] for r in page]
+        if before is None:
+            break
+    assert seen == want and len(want) > 2
+    assert tbl.page(5, None, exp_id="nope") == ([], None)
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_find_and_after(kind, tmp_path):
+    tbl = _table(kind, tmp_path)
+    rows = _fill(tbl)
+    assert [r["id"] for r in tbl.find(ts_min=1010, ts_max=1012)] == ["r010", "r011", "r012"]
+    assert [r["id"] for r in tbl.find(exp_id="e2", ts_min=1020)] == ["r020", "r023", "r026", "r029"]
+    with pytest.raises(ValueError):
+        tbl.find(name="x")
+    got, seq = [], -1
+    while True:
+        batch = tbl.after(seq, 4, exp_id="e0", status="done")
+        if not batch:
+            break
+        seq = batch[-1][0]
+        got += [r["id"] for _, r in batch]
+    assert got == [r["id"] for r in rows if r["exp_id"] == "e0" and r["status"] == "done"]
+
+
+def test_sqlite_rows_and_etags_survive_a_reopen(tmp_path):
+    tbl = _table("sqlite", tmp_path)
+    _fill(tbl, 5)
+    tag = tbl.version()[0]
+    again = _table("sqlite", tmp_path)
+    assert again.version()[0] == tag and [r["id"] for r in again.find()] == ["r000", "r001", "r002", "r003", "r004"]
+    other = main.SqliteTable(main._SqlitePool(str(tmp_path / "other.db")), "rows", key="id", indexes=("ts",))
+    other.insert_many([{"id": f"x{i}", "ts": i} for i in range(5)])
+    assert other.version()[0] != tag  # another database never produces the same ETag
@@ -0,0 +1,78 @@
+import os, sys, json, hashlib
+
+os.environ.setdefault("DATA_DIR", "")  # in-memory storage; nothing written next to the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+from fastapi.testclient import TestClient
+import main
+
+CHUNK = 1024
+
+
+@pytest.fixture(scope="module")
+def api():
+    c = TestClient(main.app)
+    tok = c.post("/login", data={"username": "admin", "password": "admin123"}).json()["access_token"]
+    c.headers["Authorization"] = f"Bearer {tok}"
+    exp = c.post("/rnd/experiments/create", data={"payload": json.dumps({"title": "uploads"})}).json()["experiment"]
+    return c, exp["id"]
+
+
+def _initiate(c, exp_id, data, sha=None):
+    r = c.post("/rnd/uploads", data={"exp_id": exp_id, "name": "run.bin", "size": len(data),
+                                     "sha256": sha or hashlib.sha256(data).hexdigest()})
+    assert r.status_code == 200
+    up = r.json()["upload"]
+    assert up["chunk_size"] == CHUNK
+    return up["id"]
+
+
+def _put(c, uid, data, n):
+    r = c.put(f"/rnd/uploads/{uid}/chunks/{n}", content=data[n * CHUNK:(n + 1) * CHUNK])
+    assert r.status_code == 200 and r.json()["offset"] == n * CHUNK
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_CHUNK_BYTES", CHUNK)
+
+
+def test_chunks_in_any_order_then_resume_the_missing_ones(api):
+    c, exp_id = api
+    data = os.urandom(5 * CHUNK + 100)
+    uid = _initiate(c, exp_id, data)
+    for n in (5, 0, 3, 1):
+        _put(c, uid, data, n)
+    status = c.get(f"/rnd/uploads/{uid}").json()
+    assert status["missing"] == [[2 * CHUNK, 3 * CHUNK], [4 * CHUNK, 5 * CHUNK]] and not status["complete"]
+    assert status["received_bytes"] == len(data) - 2 * CHUNK
+    assert c.post(f"/rnd/uploads/{uid}/finalize").status_code == 409
+    for n in (4, 2, 2):  # a chunk sent twice is harmless
+        _put(c, uid, data, n)
+    assert c.get(f"/rnd/uploads/{uid}").json()["complete"]
+    r = c.post(f"/rnd/uploads/{uid}/finalize")
+    assert r.status_code == 200
+    result = r.json()["result"]
+    assert result["sha256"] == hashlib.sha256(data).hexdigest() and result["bytes"] == len(data)
+    assert c.get(f"/rnd/results/{result['id']}/download").content == data
+    assert c.get(f"/rnd/uploads/{uid}").status_code == 404  # upload state is gone once filed
+
+
+def test_sha256_mismatch_discards_the_upload(api):
+    c, exp_id = api
+    data = os.urandom(2 * CHUNK)
+    uid = _initiate(c, exp_id, data, sha=hashlib.sha256(b"something else").hexdigest())
+    _put(c, uid, data, 0); _put(c, uid, data, 1)
+    r = c.post(f"/rnd/uploads/{uid}/finalize")
+    assert r.status_code == 422 and "sha256 mismatch" in r.json()["detail"]
+    assert c.get(f"/rnd/uploads/{uid}").status_code == 404
+    assert not os.path.exists(main._upload_path(uid))
+
+
+def test_chunks_past_the_declared_size_are_rejected(api):
+    c, exp_id = api
+    data = os.urandom(CHUNK)
+    uid = _initiate(c, exp_id, data)
+    assert c.put(f"/rnd/uploads/{uid}/chunks/0", content=data + b"x").status_code == 413
+    assert c.put(f"/rnd/uploads/{uid}/chunks/5").status_code == 416
+    assert c.get(f"/rnd/uploads/{uid}").json()["missing"] == [[0, CHUNK]]